@@ -0,0 +1,367 @@
+"""
+End-to-end load benchmark for /api-endpoint.
+
+Runs the real FastAPI app under uvicorn with local stand-ins for every
+external dependency:
+
+- a fake model behind `builder_agent.model` with configurable latency, output size
+  and injected 429 throttling
+- a local bare git repository as `origin` (plumbing commit engine)
+- a local HTTP server acting as both the evaluator and the GitHub Pages API
+
+Requests are replayed from an NDJSON file of TaskRequest objects (or
+synthesized) at a fixed concurrency. Per-stage and end-to-end p50/p95/p99
+and requests per second are printed and saved as JSON so runs can be
+compared over time.
+
+    python benchmarks/bench_pipeline.py --count 50 --concurrency 8 --model-latency 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BENCH_SECRET = "bench-secret"
+
+
+# --- Fake model -------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeThrottle(Exception):
+    """Looks like the provider's 429 RESOURCE_EXHAUSTED error to the scheduler."""
+    code = 429
+
+
+class FakeModel:
+    """
+    Stands in for `genai.GenerativeModel`: sleeps `latency` seconds and returns
+    `output_chars` of code. A `throttle_rate` share of calls fails with a 429,
+    as does every call beyond `max_concurrent` running at once.
+    """
+
+    def __init__(self, latency: float, output_chars: int, chunks: int = 8,
+                 throttle_rate: float = 0.0, max_concurrent: int = 0):
+        self.latency = latency
+        self.output_chars = output_chars
+        self.chunks = max(1, chunks)
+        self.throttle_rate = throttle_rate
+        self.max_concurrent = max_concurrent
+        self.calls = 0
+        self.throttled = 0
+        self.active = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(1234)
+
+    def _check_throttle(self):
+        with self._lock:
+            if (self._random.random() < self.throttle_rate
+                    or (self.max_concurrent and self.active >= self.max_concurrent)):
+                self.throttled += 1
+                raise FakeThrottle("429 Resource has been exhausted (e.g. check quota).")
+            self.active += 1
+
+    def _render(self) -> str:
+        share = max(1, self.output_chars // 3)
+        html = "<!DOCTYPE html>\n<html><body><h1>Bench</h1>" + "<p>x</p>" * (share // 8) + "</body></html>"
+        css = "body { margin: 0; }\n" + ".c { color: red; }\n" * (share // 19)
+        js = "console.log('bench');\n" + "let v = 1;\n" * (share // 11)
+        return f"```html\n{html}\n```\n```css\n{css}\n```\n```js\n{js}\n```\n"
+
+    def _done(self):
+        with self._lock:
+            self.active -= 1
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        with self._lock:
+            self.calls += 1
+        self._check_throttle()
+        text = self._render()
+        if not stream:
+            try:
+                time.sleep(self.latency)
+            finally:
+                self._done()
+            return FakeResponse(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        try:
+            size = -(-len(text) // self.chunks)
+            for i in range(0, len(text), size):
+                time.sleep(self.latency / self.chunks)
+                yield FakeResponse(text[i:i + size])
+        finally:
+            self._done()
+
+
+# --- Evaluator + GitHub API stub ---------------------------------------------
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.evaluations = {}
+        self.pages_enabled = set()
+        self.api_calls = 0
+
+
+def make_stub_handler(state: StubState):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, code, body=None):
+            data = json.dumps(body).encode() if body is not None else b""
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("X-RateLimit-Remaining", "5000")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_POST(self):
+            body = self._body()
+            if self.path == "/evaluate":
+                with state.lock:
+                    state.evaluations[body.get("nonce")] = time.time()
+                return self._send(200, {"ok": True})
+            if self.path.endswith("/pages"):
+                with state.lock:
+                    state.api_calls += 1
+                    state.pages_enabled.add(self.path)
+                return self._send(201, {"source": body.get("source")})
+            self._send(404, {})
+
+        def do_GET(self):
+            with state.lock:
+                state.api_calls += 1
+            if self.path.endswith("/pages"):
+                if self.path in state.pages_enabled:
+                    return self._send(200, {"status": "built"})
+                return self._send(404, {})
+            if self.path.endswith("/pages/builds/latest"):
+                return self._send(200, {"status": "built", "commit": None})
+            self._send(404, {})
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- Helpers ----------------------------------------------------------------
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return round(ordered[int(rank) - 1], 4)
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 4) if values else None,
+    }
+
+
+def load_requests(path, count: int, run_id: str, evaluation_url: str) -> list:
+    """Read TaskRequest lines from an NDJSON file (or synthesize them) and make each one unique to this run."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            base = [json.loads(line) for line in f if line.strip()]
+    else:
+        base = [{
+            "email": "bench@example.com",
+            "task": f"bench-{i}",
+            "round": 1,
+            "nonce": f"n{i}",
+            "brief": "Create a page that shows the current time.",
+            "checks": [],
+        } for i in range(count)]
+
+    requests_ = []
+    for i in range(count or len(base)):
+        req = dict(base[i % len(base)])
+        req.setdefault("checks", [])
+        req["secret"] = BENCH_SECRET
+        req["evaluation_url"] = evaluation_url
+        req["nonce"] = f"{req.get('nonce', i)}-{run_id}-{i}"
+        requests_.append(req)
+    return requests_
+
+
+def run_one(session, base_url: str, req: dict, timeout: float) -> dict:
+    started = time.time()
+    response = session.post(f"{base_url}/api-endpoint", json=req, timeout=timeout)
+    if response.status_code not in (200, 202):
+        return {"ok": False, "error": f"HTTP {response.status_code}", "nonce": req["nonce"], "started": started}
+    job = response.json()
+    deadline = started + timeout
+    while job["status"] not in ("succeeded", "failed") and time.time() < deadline:
+        time.sleep(0.02)
+        job = session.get(f"{base_url}/jobs/{job['job_id']}", timeout=timeout).json()
+    finished = time.time()
+    return {
+        "ok": job["status"] == "succeeded",
+        "error": job.get("error"),
+        "nonce": req["nonce"],
+        "started": started,
+        "latency": finished - started,
+        "timings": job.get("timings", {}),
+    }
+
+
+# --- Main -------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", help="NDJSON file of TaskRequest objects to replay")
+    parser.add_argument("--count", type=int, default=20, help="Number of requests to send (cycles the file)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Seconds per fake model call")
+    parser.add_argument("--model-output-chars", type=int, default=6000)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of model calls failing with 429")
+    parser.add_argument("--model-max-concurrent", type=int, default=0,
+                        help="Fake provider concurrency quota; calls beyond it get 429 (0 = unlimited)")
+    parser.add_argument("--workers", type=int, default=4, help="JOB_WORKERS for the app")
+    parser.add_argument("--commit-window", type=float, default=0.0, help="COMMIT_WINDOW_SECONDS for the app")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Where to write the JSON report (default benchmarks/results/<utc>.json)")
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    workdir = Path(tempfile.mkdtemp(prefix="llm-app-bench-"))
+    origin = workdir / "origin.git"
+    subprocess.run(["git", "init", "-q", "--bare", str(origin)], check=True)
+
+    stub_state = StubState()
+    stub = ThreadingHTTPServer(("127.0.0.1", free_port()), make_stub_handler(stub_state))
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+
+    os.environ.update({
+        "SECRET_KEY": BENCH_SECRET,
+        "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "bench"),
+        "GITHUB_USERNAME": "bench",
+        "GITHUB_TOKEN": "bench",
+        "GIT_REMOTE_URL": str(origin),
+        "GITHUB_API_URL": stub_url,
+        "COMMIT_ENGINE": "plumbing",
+        "COMMIT_WINDOW_SECONDS": str(args.commit_window),
+        "JOB_WORKERS": str(args.workers),
+        "JOB_QUEUE_SIZE": str(max(100, args.count)),
+        "LLM_CACHE_ENABLED": "false",
+        "LLM_BACKOFF_BASE": "0.1",
+        "LLM_RPM": os.environ.get("LLM_RPM", "100000"),
+        "IDEMPOTENCY_DB": str(workdir / "idempotency.sqlite3"),
+        "OUTBOX_DIR": str(workdir / "outbox"),
+    })
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    logging.disable(logging.INFO)
+
+    import uvicorn
+    import requests
+    import builder_agent
+    import main as app_module
+
+    fake_model = FakeModel(args.model_latency, args.model_output_chars,
+                           throttle_rate=args.throttle_rate, max_concurrent=args.model_max_concurrent)
+    builder_agent.model = fake_model
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    reqs = load_requests(args.requests, args.count, run_id, f"{stub_url}/evaluate")
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    print(f"Running {len(reqs)} requests at concurrency {args.concurrency} (workdir {workdir})")
+    bench_started = time.time()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(lambda r: run_one(session, base_url, r, args.timeout), reqs))
+    bench_elapsed = time.time() - bench_started
+
+    # The evaluator is notified from the outbox after the job finishes; give it a moment
+    deadline = time.time() + 10
+    while time.time() < deadline and len(stub_state.evaluations) < sum(r["ok"] for r in results):
+        time.sleep(0.05)
+
+    server.should_exit = True
+    stub.shutdown()
+
+    ok = [r for r in results if r["ok"]]
+    stages = sorted({stage for r in ok for stage in r["timings"]})
+    delivery = [stub_state.evaluations[r["nonce"]] - r["started"] for r in ok if r["nonce"] in stub_state.evaluations]
+    pushes = subprocess.run(["git", "--git-dir", str(origin), "rev-list", "--count", "--all"],
+                            capture_output=True, text=True).stdout.strip()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "requests": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": sorted({r["error"] for r in results if not r["ok"] and r["error"]}),
+        "elapsed_seconds": round(bench_elapsed, 4),
+        "requests_per_second": round(len(ok) / bench_elapsed, 4) if bench_elapsed else None,
+        "end_to_end": summarize([r["latency"] for r in ok]),
+        "evaluator_delivery": summarize(delivery),
+        "stages": {stage: summarize([r["timings"][stage] for r in ok if stage in r["timings"]]) for stage in stages},
+        "model_calls": fake_model.calls,
+        "model_throttled": fake_model.throttled,
+        "commits": int(pushes or 0),
+        "github_api_calls": stub_state.api_calls,
+    }
+
+    output = Path(args.output) if args.output else (
+        REPO_ROOT / "benchmarks" / "results" / f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    print(f"Succeeded {report['succeeded']}/{report['requests']} in {report['elapsed_seconds']}s "
+          f"({report['requests_per_second']} req/s), {report['commits']} commit(s)")
+    print(f"{'stage':<14}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, summary in [("end_to_end", report["end_to_end"]), ("evaluator", report["evaluator_delivery"]),
+                          *report["stages"].items()]:
+        print(f"{name:<14}{summary['p50'] or 0:>10.3f}{summary['p95'] or 0:>10.3f}{summary['p99'] or 0:>10.3f}")
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
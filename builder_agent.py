@@ -1,7 +1,20 @@
 import os
-import re
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from utils.logger import get_logger
+from utils.llm_cache import llm_cache, make_cache_key, LLM_CACHE_ENABLED
+from utils.fence_parser import FenceParser, parse_fences, safe_relative_path, EXTENSION_LANGUAGES
+from utils.patcher import parse_search_replace, apply_edits
+from utils.metrics import LLM_TOKENS, LLM_CALLS
+from utils.model_scheduler import scheduler, CallCancelled
+from utils.asset_optimizer import source_dir, SOURCE_DIR_NAME
+from utils.manifest import write_if_changed, UNTRACKED_FILES
+from utils.static_checker import score_candidate
+from utils.attachments import describe_attachments, load_attachments
 import google.generativeai as genai
 from dotenv import load_dotenv
 
@@ -9,20 +22,314 @@ logger = get_logger(__name__)
 load_dotenv()
 
 # --- Gemini configuration ---
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GENERATION_TEMPERATURE = 0.3
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "4000"))
+
+# "single": one call; "hedge": race a second call against a slow first one;
+# "candidates": GENERATION_CANDIDATES concurrent calls, the best by the static checker wins
+GENERATION_MODE = os.getenv("GENERATION_MODE", "single")
+# The hedged call is sent once the first one is slower than this percentile of recent calls
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+# Used until enough calls have completed to know the percentile
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "30"))
+GENERATION_CANDIDATES = int(os.getenv("GENERATION_CANDIDATES", "3"))
+CHECKER_PROCESSES = int(os.getenv("CHECKER_PROCESSES", "2"))
+GENERATION_MODES = ("single", "hedge", "candidates")
+
+# Fence language -> default file in the app sources for blocks without a file name
+FENCE_FILES = {
+    "html": "index.html",
+    "css": "style.css",
+    "js": "script.js",
+    "markdown": "README.md",
+}
+
 try:
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     if not GOOGLE_API_KEY:
         raise ValueError("GOOGLE_API_KEY environment variable not set.")
     genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel("gemini-2.5-flash")
+    model = genai.GenerativeModel(MODEL_NAME)
 except Exception as e:
     logger.error(f"Gemini initialization failed: {e}")
     model = None
 
 
+def _generation_params(prompt: str, temperature: float = GENERATION_TEMPERATURE):
+    config_params = {"temperature": temperature}
+    return config_params, make_cache_key(prompt, MODEL_NAME, config_params)
+
+
+def _estimate_tokens(prompt: str) -> int:
+    """Tokens reserved with the scheduler before a call: the prompt (~4 chars/token) plus a typical response."""
+    return len(prompt) // 4 + EXPECTED_OUTPUT_TOKENS
+
+
+def _record_usage(prompt: str, text: str, usage=None):
+    """Count tokens from the response's usage metadata, estimating ~4 chars/token when absent."""
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or len(prompt) // 4
+    output_tokens = getattr(usage, "candidates_token_count", None) or len(text) // 4
+    LLM_TOKENS.inc(prompt_tokens, direction="prompt")
+    LLM_TOKENS.inc(output_tokens, direction="completion")
+    scheduler.record_tokens(prompt_tokens + output_tokens - _estimate_tokens(prompt))
+
+
+def generate_text(prompt: str, use_cache: bool = True, lane: str = "new",
+                  temperature: float = GENERATION_TEMPERATURE) -> str:
+    """
+    Call the model with the shared generation config, through the scheduler's `lane`.
+    Responses are cached by prompt, model name and config unless `use_cache` is False.
+    """
+    config_params, key = _generation_params(prompt, temperature)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            logger.info("♻️ LLM cache hit, skipping model call.")
+            LLM_CALLS.inc(outcome="cache_hit")
+            return cached
+
+    config = genai.GenerationConfig(**config_params)
+
+    def call():
+        response = model.generate_content(prompt, generation_config=config)
+        return response, response.text
+
+    try:
+        response, text = scheduler.call(call, lane=lane, tokens=_estimate_tokens(prompt))
+    except Exception:
+        LLM_CALLS.inc(outcome="error")
+        raise
+    LLM_CALLS.inc(outcome="ok")
+    _record_usage(prompt, text, getattr(response, "usage_metadata", None))
+    if use_cache:
+        llm_cache.set(key, text)
+    return text
+
+
+def stream_text(prompt: str, use_cache: bool = True, lane: str = "new",
+                temperature: float = GENERATION_TEMPERATURE, cancelled=None, on_complete=None):
+    """
+    Streaming variant of `generate_text`: yields response text chunks as they arrive.
+    A cache hit is yielded as a single chunk; a completed stream is stored in the cache.
+    A throttled call is retried only if it failed before the first chunk. Setting
+    `cancelled` before the call is admitted raises CallCancelled without calling the model.
+    `on_complete(text)` runs on the full response while the call still holds its
+    scheduler slot, so calls queued behind it can be cancelled before they start.
+    """
+    config_params, key = _generation_params(prompt, temperature)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            logger.info("♻️ LLM cache hit, skipping model call.")
+            LLM_CALLS.inc(outcome="cache_hit")
+            if on_complete:
+                on_complete(cached)
+            yield cached
+            return
+
+    config = genai.GenerationConfig(**config_params)
+    parts = []
+    usage = None
+    for attempt in itertools.count():
+        try:
+            with scheduler.slot(lane if attempt == 0 else "retry", _estimate_tokens(prompt), cancelled):
+                response = model.generate_content(prompt, generation_config=config, stream=True)
+                for chunk in response:
+                    text = chunk.text
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    parts.append(text)
+                    yield text
+                if on_complete:
+                    on_complete("".join(parts))
+            break
+        except CallCancelled:
+            LLM_CALLS.inc(outcome="cancelled")
+            raise
+        except Exception as e:
+            if parts or not scheduler.should_retry(e, attempt):
+                LLM_CALLS.inc(outcome="error")
+                raise
+            scheduler.backoff(attempt)
+    LLM_CALLS.inc(outcome="ok")
+    _record_usage(prompt, "".join(parts), usage)
+    if use_cache:
+        llm_cache.set(key, "".join(parts))
+
+
+# --- Hedged and multi-candidate generation -------------------------------------
+
+# Threads that run concurrent attempts at one generation; admission is still up to the scheduler
+_attempt_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-attempt")
+_checker_pool = None
+_checker_lock = threading.Lock()
+
+
+def _get_checker_pool():
+    global _checker_pool
+    with _checker_lock:
+        if _checker_pool is None:
+            _checker_pool = ProcessPoolExecutor(max_workers=max(1, CHECKER_PROCESSES),
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return _checker_pool
+
+
+def score_files(files: dict, checks: list) -> dict:
+    """Run the static checker in the process pool, in this process if the pool is unavailable."""
+    global _checker_pool
+    try:
+        return _get_checker_pool().submit(score_candidate, files, checks).result()
+    except (BrokenProcessPool, OSError) as e:
+        logger.warning(f"⚠️ Checker process pool unavailable ({e}). Scoring in-process.")
+        with _checker_lock:
+            _checker_pool = None
+        return score_candidate(files, checks)
+
+
+def _attempt_text(prompt: str, temperature: float, use_cache: bool, lane: str, cancelled: threading.Event,
+                  on_complete=None):
+    """
+    One streamed attempt, abandoned once `cancelled` is set: while still queued for
+    admission it never reaches the model, and mid-stream it releases its slot.
+    """
+    if cancelled.is_set():
+        return None
+    parts = []
+    chunks = stream_text(prompt, use_cache=use_cache, lane=lane, temperature=temperature, cancelled=cancelled,
+                         on_complete=on_complete)
+    try:
+        for chunk in chunks:
+            if cancelled.is_set():
+                LLM_CALLS.inc(outcome="cancelled")
+                return None
+            parts.append(chunk)
+    except CallCancelled:
+        return None
+    finally:
+        chunks.close()
+    return "".join(parts)
+
+
+def _attempt_result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        logger.warning(f"⚠️ Generation attempt failed: {e}")
+        return None
+
+
+def files_from_text(text: str) -> dict:
+    """`{path: code}` of a complete model response, first block per file wins."""
+    files = {}
+    for block in parse_fences(text or ""):
+        name = block_file_name(block)
+        if name and block.code and name not in files:
+            files[name] = block.code
+    return files
+
+
+def hedged_text(prompt: str, use_cache: bool = True, lane: str = "new", on_progress=None) -> str:
+    """
+    Generate with one call, sending a second identical one if the first has not
+    finished within HEDGE_PERCENTILE of recent call latencies (or fails, or
+    returns no index.html). The first usable response wins and the other call
+    is cancelled.
+    """
+    delay = scheduler.latency_percentile(HEDGE_PERCENTILE) or HEDGE_DEFAULT_DELAY
+    cancelled = threading.Event()
+    pending = {_attempt_pool.submit(_attempt_text, prompt, GENERATION_TEMPERATURE, use_cache, lane, cancelled)}
+    hedged = False
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged else delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                text = _attempt_result(future)
+                if "index.html" in files_from_text(text):
+                    return text
+            if not hedged:
+                hedged = True
+                logger.info(f"Sending a hedged model call (first call not usable after {delay:.1f}s).")
+                if on_progress:
+                    on_progress("hedge", after=round(delay, 3))
+                # The duplicate must not be answered from, or stored over, the first call's cache entry
+                pending.add(_attempt_pool.submit(
+                    _attempt_text, prompt, GENERATION_TEMPERATURE, False, lane, cancelled))
+    finally:
+        cancelled.set()
+        scheduler.wake()
+    raise RuntimeError("No generation attempt returned an index.html.")
+
+
+def best_candidate_text(prompt: str, checks: list = None, use_cache: bool = True, lane: str = "new",
+                        on_progress=None) -> tuple:
+    """
+    Generate GENERATION_CANDIDATES responses concurrently at increasing
+    temperatures and score each with the static checker as it arrives.
+    A candidate that passes every check ends the search and the remaining calls
+    are cancelled. Returns `(text, score)` of the best candidate.
+    """
+    cancelled = threading.Event()
+    scores = {}
+    # Start the checker processes while the model works
+    _get_checker_pool()
+
+    def check(i):
+        # Scored before the call gives up its slot, so a perfect candidate
+        # cancels the ones still queued behind it before they reach the model
+        def on_complete(text):
+            scores[i] = score_files(files_from_text(text), checks or [])
+            if scores[i]["score"] >= 1.0:
+                cancelled.set()
+                scheduler.wake()
+        return on_complete
+
+    futures = {}
+    for i in range(max(1, GENERATION_CANDIDATES)):
+        temperature = min(1.0, GENERATION_TEMPERATURE + 0.2 * i)
+        futures[_attempt_pool.submit(_attempt_text, prompt, temperature, use_cache, lane, cancelled, check(i))] = i
+
+    best = None
+    try:
+        for future in as_completed(futures):
+            text = _attempt_result(future)
+            if not text:
+                continue
+            score = scores[futures[future]]
+            logger.info(f"Candidate {futures[future]} scored {score['score']:.2f} "
+                        f"({len(score['passed'])} passed, {len(score['failed'])} failed).")
+            if on_progress:
+                on_progress("candidate", candidate=futures[future], score=score["score"],
+                            passed=len(score["passed"]), failed=len(score["failed"]))
+            if best is None or score["score"] > best[1]["score"]:
+                best = (text, score)
+            if score["score"] >= 1.0:
+                break
+    finally:
+        cancelled.set()
+        scheduler.wake()
+    if best is None:
+        raise RuntimeError("Every generation candidate failed.")
+    return best
+
+
+def checks_section(checks: list) -> str:
+    """Prompt lines listing the checks the evaluator will run, if any."""
+    if not checks:
+        return ""
+    lines = "\n".join(f"    - {check}" for check in checks)
+    return f"""
+    The app will be evaluated with these checks; make sure every one passes:
+{lines}
+"""
+
+
 def generate_readme_fallback(brief: str, attachments: list, task: str, round_num: int = 1) -> str:
     """Fallback README if LLM doesn't provide one."""
-    attachments_list = "\n".join([f"- {a['name']}: {a['url']}" for a in attachments]) or "None"
+    attachments_list = "\n".join(
+        [f"- {a['name']}: {a.get('path') or a.get('url', 'inline data')}" for a in attachments]) or "None"
     return f"""# {task}
 
 ## Summary
@@ -50,25 +357,80 @@ MIT License
 """
 
 
-def generate_app_code(task: str, brief: str, attachments: list = None, round_num: int = 1) -> dict:
+def block_file_name(block):
+    """File a parsed code block belongs to: its annotated name, else the default for its language."""
+    return block.filename or FENCE_FILES.get(block.lang)
+
+
+def write_app_files(output_dir: Path, files: dict, on_progress=None, reserved=()) -> dict:
+    """
+    Write `{relative_path: code}` into `output_dir` in one batch, creating
+    subfolders as needed. Paths that escape the folder or are `reserved`
+    (attachments) are skipped, and files that already hold the same content
+    are left untouched.
+    Returns the accepted files, whether or not they had to be rewritten.
+    """
+    written = {}
+    root = output_dir.resolve()
+    for name, code in files.items():
+        relative = safe_relative_path(name)
+        target = (root / relative).resolve() if relative else None
+        if target is None or not target.is_relative_to(root) or relative in UNTRACKED_FILES:
+            logger.warning(f"⚠️ Ignoring file '{name}' outside the app folder.")
+            continue
+        if relative in reserved:
+            logger.warning(f"⚠️ Not overwriting attachment '{relative}' with generated code.")
+            continue
+        written[relative] = code
+        if write_if_changed(target, code) and on_progress:
+            on_progress("file", file=relative, bytes=len(code.encode("utf-8")))
+    return written
+
+
+def read_app_files(output_dir: Path) -> dict:
+    """All text source files of an app, keyed by path relative to `output_dir`."""
+    files = {}
+    for path in sorted(output_dir.rglob("*")):
+        relative = path.relative_to(output_dir).as_posix()
+        if (path.is_file() and path.suffix.lower() in EXTENSION_LANGUAGES
+                and relative not in UNTRACKED_FILES):
+            files[relative] = path.read_text()
+    return files
+
+
+def generate_app_code(task: str, brief: str, attachments: list = None, round_num: int = 1,
+                      use_cache: bool = True, stream: bool = LLM_STREAMING, on_progress=None,
+                      checks: list = None, mode: str = GENERATION_MODE) -> dict:
     """
     Generate minimal web app (HTML/CSS/JS) + README.md from brief using Gemini.
-    Returns a dict with `files` and `attachments`.
+    Returns a dict with `files` and `attachments` (and the checker `score`
+    in "candidates" mode).
+
+    With `stream` in "single" mode, the response is parsed while it arrives and
+    each file is written as soon as its code block closes. `on_progress(event, **data)`
+    is called for every received chunk and every written file. `mode` selects
+    hedged or multi-candidate generation (see GENERATION_MODE); `checks` are
+    added to the prompt and used to score candidates.
     """
     if not model:
         logger.error("Gemini model unavailable. Cannot generate code.")
         return {}
 
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown GENERATION_MODE '{mode}', expected one of {', '.join(GENERATION_MODES)}")
+
     attachments = attachments or []
-    output_dir = Path("generated") / task
+    output_dir = source_dir(Path("generated") / task)
     output_dir.mkdir(parents=True, exist_ok=True)
+    reserved = {a["path"] for a in attachments if "path" in a}
 
-    attachment_info = "\n".join([f"{a['name']}: {a['url']}" for a in attachments])
     prompt = f"""
     You are an expert frontend developer.
     Task: {task}
     Brief: {brief}
-    Attachments: {attachment_info or 'None'}
+    Attachments:
+{describe_attachments(attachments)}
+{checks_section(checks)}
 
     Generate minimal working HTML, CSS, JS, and README.md.
     Response must contain code blocks:
@@ -76,114 +438,184 @@ def generate_app_code(task: str, brief: str, attachments: list = None, round_num
     - ```css``` for CSS
     - ```js``` for JS
     - ```markdown``` for README.md (optional)
+    For any additional file, put its relative path after the language,
+    e.g. ```js lib/helpers.js or ```json data/items.json.
     Only include code blocks, no extra text.
     """
 
     logger.info(f"Generating code for task: {task}")
+    # First deploys are served ahead of rebuilds of later rounds
+    lane = "new" if round_num == 1 else "update"
+
+    files = {}
+    score = None
+    # Files can only be written as they arrive when a single response is consumed
+    incremental = stream and mode == "single"
+
+    def notify(event, **data):
+        if on_progress:
+            on_progress(event, **data)
+
+    def collect(blocks):
+        for block in blocks:
+            name = block_file_name(block)
+            if name and block.code and name not in files:
+                files[name] = block.code
+                if incremental:
+                    write_app_files(output_dir, {name: block.code}, notify, reserved)
 
     try:
-        config = genai.GenerationConfig(temperature=0.3)
-        response = model.generate_content(prompt, generation_config=config)
-        text = response.text
+        if mode == "hedge":
+            collect(parse_fences(hedged_text(prompt, use_cache=use_cache, lane=lane, on_progress=on_progress)))
+        elif mode == "candidates":
+            text, score = best_candidate_text(prompt, checks, use_cache=use_cache, lane=lane,
+                                              on_progress=on_progress)
+            collect(parse_fences(text))
+        elif stream:
+            parser = FenceParser()
+            received = 0
+            for chunk in stream_text(prompt, use_cache=use_cache, lane=lane):
+                received += len(chunk)
+                notify("chunk", chars=received)
+                collect(parser.feed(chunk))
+            collect(parser.close())
+        else:
+            collect(parse_fences(generate_text(prompt, use_cache=use_cache, lane=lane)))
     except Exception as e:
         logger.error(f"Failed to generate code: {e}")
         return {}
 
-    def extract_code(text, lang):
-        pattern = f"```{lang}\\s*(.*?)```"
-        match = re.search(pattern, text, re.DOTALL)
-        return match.group(1).strip() if match else ""
-
-    html_code = extract_code(text, "html") or "<!-- Missing HTML -->"
-    css_code = extract_code(text, "css") or "/* Missing CSS */"
-    js_code = extract_code(text, "js") or "// Missing JS"
-    readme_code = extract_code(text, "markdown") or generate_readme_fallback(brief, attachments, task, round_num)
+    streamed = set(files) if incremental else set()
+    placeholders = {
+        "index.html": "<!-- Missing HTML -->",
+        "style.css": "/* Missing CSS */",
+        "script.js": "// Missing JS",
+        "README.md": generate_readme_fallback(brief, attachments, task, round_num),
+    }
+    for name, placeholder in placeholders.items():
+        files.setdefault(name, placeholder)
 
-    # Save to folder
-    (output_dir / "index.html").write_text(html_code)
-    (output_dir / "style.css").write_text(css_code)
-    (output_dir / "script.js").write_text(js_code)
-    (output_dir / "README.md").write_text(readme_code)
+    # Save whatever was not already written while streaming, in one batch
+    write_app_files(output_dir, {n: c for n, c in files.items() if n not in streamed}, notify, reserved)
 
-    logger.info(f"Generated app + README at: {output_dir.resolve()}")
+    logger.info(f"Generated app + README ({len(files)} files) at: {output_dir.resolve()}")
 
-    return {
-        "files": {
-            "index.html": html_code,
-            "style.css": css_code,
-            "script.js": js_code,
-            "README.md": readme_code
-        },
+    result = {
+        "files": files,
         "attachments": attachments
     }
+    if score is not None:
+        result["score"] = score
+    return result
 
 
-def update_app_code(task: str, brief: str, attachments: list = None, round_num: int = 2) -> dict:
+def update_app_code(task: str, brief: str, attachments: list = None, round_num: int = 2,
+                    use_cache: bool = True, on_progress=None, checks: list = None) -> dict:
     """
     Update existing app files (HTML/CSS/JS) + README.md based on a new brief.
     Returns dict with `files` and `attachments`.
+
+    The current files are sent as context and the model answers with
+    search/replace edits, which are applied locally. Only files whose edits
+    fail to apply are requested again as full rewrites.
     """
-    output_dir = Path("generated") / task
-    if not output_dir.exists():
+    if not model:
+        logger.error("Gemini model unavailable. Cannot update code.")
+        return {}
+
+    app_dir = Path("generated") / task
+    if not app_dir.exists():
         raise FileNotFoundError(f"No app found for task '{task}'. Run build first.")
+    output_dir = source_dir(app_dir)
 
     attachments = attachments or []
-    attachment_info = "\n".join([f"{a['name']}: {a['url']}" for a in attachments])
+    # Attachments of every round so far are data, not code to edit
+    reserved = {a["path"] for a in load_attachments(app_dir).values()}
+
+    # Apps deployed before sources were kept separately are read from the app folder
+    legacy = not (output_dir / "index.html").exists()
+    existing = {
+        n: c for n, c in read_app_files(app_dir if legacy else output_dir).items()
+        if n not in reserved and n.split("/", 1)[0] != SOURCE_DIR_NAME
+    }
+    current_files = "\n\n".join(f"{name}\n````\n{code}\n````" for name, code in existing.items())
 
     prompt = f"""
     You are a senior frontend engineer updating an existing web app.
     Task: {task}
     New Brief: {brief}
-    Attachments: {attachment_info or 'None'}
+    Attachments:
+{describe_attachments(attachments)}
+{checks_section(checks)}
+    Current files:
 
-    The folder contains index.html, style.css, script.js, README.md.
-    Update code to match the new brief.
-    Response must contain code blocks:
-    - ```html``` full updated HTML
-    - ```css``` full updated CSS
-    - ```js``` full updated JS
-    - ```markdown``` updated README.md (optional)
-    Only include code blocks, no extra text.
+{current_files}
+
+    Update the code to match the new brief with the smallest possible edits.
+    Answer only with search/replace blocks, one per change, in this format:
+
+    style.css
+    <<<<<<< SEARCH
+    exact existing lines to replace
+    =======
+    new lines
+    >>>>>>> REPLACE
+
+    The SEARCH part must copy the existing lines exactly and match only once.
+    Use an empty SEARCH part to create a new file. No extra text.
     """
 
     logger.info(f"Updating app for task: {task}, Round {round_num}")
 
     try:
-        config = genai.GenerationConfig(temperature=0.3)
-        response = model.generate_content(prompt, generation_config=config)
-        text = response.text
+        text = generate_text(prompt, use_cache=use_cache, lane="update")
     except Exception as e:
         logger.error(f"Failed to update code: {e}")
         return {}
 
-    def extract_code(text, lang):
-        pattern = f"```{lang}\\s*(.*?)```"
-        match = re.search(pattern, text, re.DOTALL)
-        return match.group(1).strip() if match else ""
+    updated, failed = apply_edits(existing, parse_search_replace(text))
+    failed &= set(existing)
+    logger.info(f"Applied edits to {len(updated)} file(s); {len(failed)} file(s) need a full rewrite.")
 
-    html_code = extract_code(text, "html") or (output_dir / "index.html").read_text()
-    css_code = extract_code(text, "css") or (output_dir / "style.css").read_text()
-    js_code = extract_code(text, "js") or (output_dir / "script.js").read_text()
-    readme_code = extract_code(text, "markdown") or generate_readme_fallback(brief, attachments, task, round_num)
+    if failed:
+        rewrite_prompt = f"""
+    You are a senior frontend engineer updating an existing web app.
+    Task: {task}
+    New Brief: {brief}
+
+    Current files:
 
-    # Write updated files
-    (output_dir / "index.html").write_text(html_code)
-    (output_dir / "style.css").write_text(css_code)
-    (output_dir / "script.js").write_text(js_code)
-    (output_dir / "README.md").write_text(readme_code)
+{current_files}
+
+    Rewrite only these files in full to match the new brief: {', '.join(sorted(failed))}.
+    Response must contain one code block per file, with the language and the
+    file path on the opening fence line, e.g. ```css style.css
+    Only include code blocks, no extra text.
+    """
+        try:
+            rewrites = {}
+            for block in parse_fences(generate_text(rewrite_prompt, use_cache=use_cache, lane="update")):
+                name = block_file_name(block)
+                if name in failed and block.code and name not in rewrites:
+                    rewrites[name] = block.code
+            updated.update(rewrites)
+        except Exception as e:
+            logger.error(f"Failed to rewrite files {sorted(failed)}: {e}")
+
+    # Write updated files, refusing any path that escapes the task folder
+    if legacy:
+        write_app_files(output_dir, {n: c for n, c in existing.items() if n not in updated})
+    updated = write_app_files(output_dir, updated, on_progress, reserved)
 
     # Log the update
-    with open(output_dir / "update_log.txt", "a", encoding="utf-8") as f:
+    with open(app_dir / "update_log.txt", "a", encoding="utf-8") as f:
         f.write(f"Updated for Round {round_num} with new brief: {brief}\n")
 
     logger.info(f"App + README updated successfully at: {output_dir.resolve()}")
 
     return {
-        "files": {
-            "index.html": html_code,
-            "style.css": css_code,
-            "script.js": js_code,
-            "README.md": readme_code
-        },
+        "files": {**existing, **updated},
+        "patched": sorted(set(updated) - failed),
+        "rewritten": sorted(set(updated) & failed),
         "attachments": attachments
     }
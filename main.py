@@ -1,12 +1,26 @@
 import os
-import time
-from fastapi import FastAPI, HTTPException
-from models import TaskRequest, APIResponse
-from builder_agent import generate_app_code
+import json
+import uuid
+import asyncio
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from models import TaskRequest, JobResponse
+from builder_agent import generate_app_code, update_app_code
 from utils.verifier import verify_secret
-from utils.git_helper import git_commit_and_push, enable_github_pages
-from utils.evaluator import notify_evaluator
+from utils.git_helper import enable_github_pages
+from utils.github_client import github_client
+from utils.commit_coalescer import coalescer
+from utils.repo_router import router
+from utils.asset_optimizer import optimize_app, ASSET_OPTIMIZATION
+from utils.attachments import ingest_attachments
+from utils.manifest import snapshot, unchanged_commit, record_deploy, load_manifest, diff_files
+from utils.evaluator import notify_evaluator, outbox
+from utils.llm_cache import llm_cache
+from utils.job_queue import JobQueue, QueueFullError
+from utils.idempotency import IdempotencyStore, make_idempotency_key
 from utils.logger import get_logger
+from utils.metrics import registry, Gauge, STAGE_SECONDS
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -16,72 +30,419 @@ app = FastAPI(title="LLM App Deployer", version="2.0")
 
 # Load environment variables
 GITHUB_USERNAME = os.getenv("GITHUB_USERNAME")
-REPO_NAME = os.getenv("REPO_NAME", "llm-app-deployer")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Batch submissions: tasks of one batch deployed at a time, and the longest accepted NDJSON line
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_LINE_BYTES = int(os.getenv("BATCH_MAX_LINE_BYTES", str(1024 * 1024)))
+PAGES_WAIT_FOR_BUILD = os.getenv("PAGES_WAIT_FOR_BUILD", "false").lower() in ("1", "true", "yes")
 
-@app.post("/api-endpoint", response_model=APIResponse)
-async def handle_task(task_req: TaskRequest):
-    """
-    Full deployment pipeline:
-    1. Verify secret
-    2. Generate app code
-    3. Commit & push to GitHub
-    4. Enable GitHub Pages
-    5. Notify evaluator with the correct URL
+
+async def run_pipeline(task_req: TaskRequest, job) -> dict:
     """
-    logger.info(f"🚀 Received request for task '{task_req.task}' (Round {task_req.round})")
+    Full deployment pipeline, executed by a job queue worker:
+    1. Generate app code (round 2+ updates the existing files)
+    2. Optimize assets (minify, inline small CSS, content-hash file names)
+    3. Commit & push to GitHub (batched with concurrent deploys; skipped when no file changed)
+    4. Enable GitHub Pages (optionally waiting for the build of the new commit)
+    5. Queue the evaluator notification with the correct URL
 
-    # Step 1: Verify secret
-    if not verify_secret(task_req.secret):
-        logger.warning("❌ Invalid secret provided.")
-        raise HTTPException(status_code=403, detail="Invalid secret")
+    Every blocking stage runs in a thread so the event loop stays responsive.
+    """
+    # Every repository-specific step follows the task's route (see REPO_ROUTING)
+    route = await asyncio.to_thread(router.route, task_req.task)
 
-    # Step 2: Generate app code
-    attachments_list = [a.dict() for a in task_req.attachments] if task_req.attachments else []
+    # Step 1: Store attachments next to the app; the model only sees a summary of them
     task_folder = str(Path("generated") / task_req.task)
-    generate_app_code(task_req.task, task_req.brief, attachments_list)
-    
-    # Step 3: Git commit & push
-    try:
-        commit_sha = git_commit_and_push(
-            task_folder, task_req.task, f"Deploy {task_req.task} (Round {task_req.round})"
-        )
-    except Exception as e:
-        logger.exception("❌ Git operation failed")
-        raise HTTPException(status_code=500, detail=f"Git operation failed: {e}")
+    attachments_list = [a.dict() for a in task_req.attachments] if task_req.attachments else []
+    if attachments_list:
+        job.set_stage("attachments")
+        attachments_list = await asyncio.to_thread(ingest_attachments, task_folder, attachments_list, job.emit)
 
-    # Step 4: Enable GitHub Pages
+    # Step 2: Generate app code (later rounds patch the existing app)
+    job.set_stage("generate")
+    builder = generate_app_code
+    if task_req.round > 1 and (Path(task_folder) / "index.html").exists():
+        builder = update_app_code
+    generated = await asyncio.to_thread(
+        builder, task_req.task, task_req.brief, attachments_list, task_req.round,
+        use_cache=task_req.use_cache, on_progress=job.emit, checks=task_req.checks
+    )
+    if not generated:
+        # Never deploy placeholder files when the model could not be reached
+        raise RuntimeError("Code generation failed; nothing was deployed.")
+
+    # Step 3: Build the optimized app from the generated sources
+    assets = None
+    if ASSET_OPTIMIZATION:
+        job.set_stage("optimize")
+        report = await asyncio.to_thread(optimize_app, task_folder)
+        assets = {k: report[k] for k in ("original_bytes", "optimized_bytes", "saved_bytes")}
+        job.emit("assets", **assets)
+
+    # Step 4: Git commit & push, unless the files match the last deploy of this task
+    job.set_stage("commit")
+    files = await asyncio.to_thread(snapshot, task_folder)
+    commit_sha = await asyncio.to_thread(unchanged_commit, task_folder, files)
+    changed = commit_sha is None
+    if changed:
+        try:
+            commit_sha = await asyncio.wrap_future(coalescer.submit(
+                task_folder, task_req.task, f"Deploy {task_req.task} (Round {task_req.round})", repo=route.repo
+            ))
+        except Exception as e:
+            logger.exception("❌ Git operation failed")
+            raise RuntimeError(f"Git operation failed: {e}")
+    else:
+        logger.info(f"♻️ No changes for '{task_req.task}'. Reusing commit {commit_sha}.")
+        job.emit("unchanged", commit_sha=commit_sha)
+    await asyncio.to_thread(record_deploy, task_folder, task_req.round, commit_sha, files, route.repo)
+
+    # Step 5: Enable GitHub Pages
+    job.set_stage("pages")
     try:
-        enable_github_pages(REPO_NAME)
+        await asyncio.to_thread(enable_github_pages, route.repo)
     except Exception as e:
         logger.warning(f"⚠️ GitHub Pages enabling encountered an issue: {e}")
 
-    # --- THE FIX IS HERE ---
-    # Step 5: Construct the correct, specific URL to the generated app
-    pages_url = f"https://{GITHUB_USERNAME}.github.io/{REPO_NAME}/generated/{task_req.task}/"
+    pages_build = None
+    if PAGES_WAIT_FOR_BUILD and changed:
+        job.set_stage("pages_build")
+        try:
+            build = await asyncio.to_thread(
+                github_client.wait_for_pages_build, GITHUB_USERNAME, route.repo, commit_sha
+            )
+            pages_build = build.get("status")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not track the GitHub Pages build: {e}")
+
+    # Construct the correct, specific URL to the generated app
+    pages_url = route.pages_url
     logger.info(f"✅ Constructed correct Pages URL: {pages_url}")
-    
-    # Step 6: Notify evaluator with the correct URL
+
+    # Step 6: Queue the evaluator notification (delivered by the outbox workers)
+    job.set_stage("notify")
     try:
-        notify_evaluator(
+        await asyncio.to_thread(
+            notify_evaluator,
             email=task_req.email,
             task=task_req.task,
             round_=task_req.round,
             nonce=task_req.nonce,
             commit_sha=commit_sha,
             github_user=GITHUB_USERNAME,
-            repo_name=REPO_NAME,
+            repo_name=route.repo,
+            repo_url=route.repo_url,
             evaluation_url=str(task_req.evaluation_url),
-            pages_url=pages_url  # Pass the correct URL
+            pages_url=pages_url
         )
     except Exception as e:
         logger.exception("❌ Evaluator notification failed")
-        raise HTTPException(status_code=500, detail=f"Evaluator notification failed: {e}")
+        raise RuntimeError(f"Evaluator notification failed: {e}")
 
     logger.info(f"✅ Task '{task_req.task}' deployed successfully.")
+    return {
+        "commit_sha": commit_sha, "repo_url": route.repo_url, "pages_url": pages_url, "pages_build": pages_build,
+        "assets": assets, "changed": changed
+    }
+
+
+idempotency_store = IdempotencyStore()
+
+
+def record_job_outcome(job):
+    idempotency_store.complete(job.id, job.status, job.result, job.error)
+
+
+job_queue = JobQueue(
+    run_pipeline, max_workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE, on_finish=record_job_outcome
+)
+
+registry.register(Gauge("job_queue_depth", "Deployments waiting for a worker.", callback=job_queue.depth))
+
+
+@app.on_event("startup")
+async def start_job_queue():
+    # Jobs that were running when the server stopped will never finish; let retries re-run them
+    idempotency_store.abandon_in_flight()
+    idempotency_store.purge_expired()
+    await job_queue.start()
+    await outbox.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+    await outbox.stop()
+
+
+@app.post("/api-endpoint", response_model=JobResponse, status_code=202)
+async def handle_task(task_req: TaskRequest, response: Response):
+    """
+    Validate the request and enqueue the deployment pipeline.
+    Returns 202 with a job id; poll `GET /jobs/{job_id}` for progress.
+
+    Requests are idempotent on (email, task, round, nonce): a duplicate of a
+    running request gets the same job, and a duplicate of a finished one gets
+    the stored result with 200.
+    """
+    logger.info(f"🚀 Received request for task '{task_req.task}' (Round {task_req.round})")
+
+    with STAGE_SECONDS.time(stage="verify"):
+        authorized = verify_secret(task_req.secret)
+    if not authorized:
+        logger.warning("❌ Invalid secret provided.")
+        raise HTTPException(status_code=403, detail="Invalid secret")
+
+    try:
+        job, stored = await admit_task(task_req)
+    except QueueFullError as e:
+        logger.warning(f"⚠️ {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    if stored is not None:
+        if stored.status == "succeeded":
+            response.status_code = 200
+        return stored
+    return JobResponse(**job.to_dict())
+
+
+async def admit_task(task_req: TaskRequest, wait_for_capacity: bool = False):
+    """
+    Deduplicate a verified request and enqueue it if it is new.
+
+    Returns `(job, stored)`: the new or in-flight Job, or, for a duplicate of a
+    finished deployment, a JobResponse built from its stored outcome. Raises
+    QueueFullError when the queue is full, unless `wait_for_capacity` is set.
+    """
+    key = make_idempotency_key(task_req.email, task_req.task, task_req.round, task_req.nonce)
+    job_id = uuid.uuid4().hex
+    existing = idempotency_store.claim(key, job_id)
+    if existing is not None:
+        running_job = job_queue.get(existing["job_id"])
+        if running_job is not None and not running_job.finished:
+            logger.info(f"🔁 Duplicate request attached to in-flight job {running_job.id}")
+            return running_job, None
+        logger.info(f"🔁 Duplicate request answered from stored state of job {existing['job_id']}")
+        finished = existing["status"] == "succeeded"
+        return None, JobResponse(
+            job_id=existing["job_id"], status=existing["status"], stage="done" if finished else "unknown",
+            result=existing["result"], error=existing["error"]
+        )
+
+    try:
+        if wait_for_capacity:
+            job = await job_queue.put(task_req, job_id=job_id)
+        else:
+            job = job_queue.submit(task_req, job_id=job_id)
+    except BaseException:
+        idempotency_store.release(key, job_id)
+        raise
+
+    logger.info(f"📥 Queued task '{task_req.task}' as job {job.id} (queue depth {job_queue.depth()})")
+    return job, None
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that leaves `receive` to the endpoint. The stock one
+    listens for a disconnect on it, which would swallow request body chunks
+    that are still being read while the response streams.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+async def read_ndjson_lines(chunks, max_line_bytes: int = BATCH_MAX_LINE_BYTES):
+    """
+    Yield `(line_number, line)` for every non-blank line of an NDJSON byte
+    stream without buffering more than one line. Lines longer than
+    `max_line_bytes` are yielded as None and their content is skipped.
+    """
+    buffer = b""
+    line_no = 0
+    oversized = False
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            newline = buffer.find(b"\n")
+            if newline == -1:
+                if len(buffer) > max_line_bytes:
+                    oversized, buffer = True, b""
+                break
+            line, buffer = buffer[:newline], buffer[newline + 1:]
+            line_no += 1
+            if oversized:
+                oversized = False
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+    if oversized:
+        yield line_no + 1, None
+    elif buffer.strip():
+        yield line_no + 1, buffer
+
+
+@app.post("/batch")
+async def handle_batch(request: Request):
+    """
+    Submit many tasks as an NDJSON stream of TaskRequest objects.
+
+    Lines are validated as they arrive and deployed through the same job queue
+    as single requests, with at most BATCH_CONCURRENCY of them unfinished at a
+    time; the request body is not read further until one finishes, so memory
+    stays flat however large the batch is. The response streams one NDJSON
+    line per input line as soon as its outcome is known, in completion order.
+    """
+    results = asyncio.Queue(maxsize=BATCH_CONCURRENCY * 2)
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    running = set()
+    done = object()
+
+    def line_result(line_no, task_req, status, job_id=None, result=None, error=None):
+        return {
+            "line": line_no,
+            "task": task_req.task if task_req else None,
+            "round": task_req.round if task_req else None,
+            "job_id": job_id,
+            "status": status,
+            "result": result,
+            "error": error,
+        }
+
+    async def deploy(line_no, task_req):
+        try:
+            job, stored = await admit_task(task_req, wait_for_capacity=True)
+            if job is not None:
+                await job.wait()
+                stored = JobResponse(**job.to_dict())
+            await results.put(line_result(line_no, task_req, stored.status, stored.job_id,
+                                          stored.result, stored.error))
+        except Exception as e:
+            logger.exception(f"❌ Batch line {line_no} failed")
+            await results.put(line_result(line_no, task_req, "failed", error=str(e)))
+        finally:
+            slots.release()
+
+    async def read_batch():
+        try:
+            async for line_no, line in read_ndjson_lines(request.stream()):
+                if line is None:
+                    await results.put(line_result(line_no, None, "invalid", error="Line too long"))
+                    continue
+                try:
+                    task_req = TaskRequest(**json.loads(line))
+                except (ValueError, TypeError) as e:
+                    await results.put(line_result(line_no, None, "invalid", error=str(e)))
+                    continue
+                if not verify_secret(task_req.secret):
+                    await results.put(line_result(line_no, task_req, "rejected", error="Invalid secret"))
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(deploy(line_no, task_req))
+                running.add(task)
+                task.add_done_callback(running.discard)
+        except Exception as e:
+            logger.exception("❌ Reading batch submission failed")
+            await results.put(line_result(None, None, "invalid", error=f"Could not read batch: {e}"))
+        # Wait for the tasks still in flight
+        for _ in range(BATCH_CONCURRENCY):
+            await slots.acquire()
+        await results.put(done)
+
+    async def stream_results():
+        reader = asyncio.create_task(read_batch())
+        try:
+            while True:
+                item = await results.get()
+                if item is done:
+                    break
+                yield json.dumps(item) + "\n"
+        finally:
+            # Client went away: stop reading and waiting; queued deployments still run to completion
+            reader.cancel()
+            for task in list(running):
+                task.cancel()
+
+    logger.info("📦 Receiving batch submission")
+    return DuplexStreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Report the current stage and, once finished, the result of a job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job.to_dict())
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events stream of a job's stage changes and per-file progress."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_source():
+        async for event in job.stream_events():
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
+
+@app.get("/tasks/{task}/manifest")
+async def get_task_manifest(task: str, from_round: Optional[int] = None, to_round: Optional[int] = None):
+    """
+    File hashes of a task's latest deploy and of every round.
+    With `from_round`, answers with the changes between that round and
+    `to_round` (default: the latest deploy) instead.
+    """
+    if "/" in task or task.startswith("."):
+        raise HTTPException(status_code=404, detail="Task not found")
+    manifest = await asyncio.to_thread(load_manifest, Path("generated") / task)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if from_round is None:
+        return manifest
+
+    rounds = manifest["rounds"]
+    old = rounds.get(str(from_round))
+    new = rounds.get(str(to_round)) if to_round is not None else manifest
+    if old is None or new is None:
+        raise HTTPException(status_code=404, detail="Round not found")
+    return {
+        "task": task,
+        "from_round": from_round,
+        "to_round": to_round if to_round is not None else manifest["round"],
+        "from_commit": old["commit_sha"],
+        "to_commit": new["commit_sha"],
+        **diff_files(old["files"], new["files"]),
+    }
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the LLM response cache."""
+    return llm_cache.stats()
+
+
+@app.get("/outbox/dead-letter")
+async def list_dead_letters():
+    """Evaluator notifications that failed permanently or ran out of attempts."""
+    return await asyncio.to_thread(outbox.dead_letters)
+
+
+@app.post("/outbox/dead-letter/{record_id}/retry")
+async def retry_dead_letter(record_id: str):
+    """Move a dead-lettered notification back into the delivery queue."""
+    record = await asyncio.to_thread(outbox.retry_dead_letter, record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Dead-letter record not found")
+    return record
 
-    # Step 7: Return the correct URL in the final response
-    return APIResponse(
-        status="success",
-        message=f"✅ App deployed successfully. View it here: {pages_url}",
-    )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: stage latency histograms, LLM token and retry counters, in-flight gauge."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -15,7 +15,16 @@ class TaskRequest(BaseModel):
     checks: List[str]
     evaluation_url: HttpUrl
     attachments: Optional[List[Attachment]] = []
+    use_cache: bool = True
 
 class APIResponse(BaseModel):
     status: str
     message: str
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    timings: Dict[str, float] = {}
@@ -0,0 +1,36 @@
+from utils.asset_optimizer import minify_css, minify_js, optimize_app
+
+
+def test_css_keeps_descendant_combinator_before_pseudo_class():
+    css = ".nav :hover { color : red; }\ndiv :not(p), .a :first-child { margin: 0 }"
+    assert minify_css(css) == ".nav :hover{color:red}div :not(p),.a :first-child{margin:0}"
+
+
+def test_js_regex_literal_is_not_read_as_comment():
+    js = "const r = /[/*]/;\nlet a = 1; /* c */ let b = 2;"
+    assert minify_js(js) == "const r = /[/*]/;\nlet a = 1; let b = 2;"
+
+
+def test_js_template_literal_lines_are_kept_verbatim():
+    js = "const t = `line1\n\n    indented`;\n\n    render(t);\n"
+    assert minify_js(js) == "const t = `line1\n\n    indented`;\nrender(t);"
+
+
+def test_inlined_stylesheet_references_are_rebased_to_the_page(tmp_path):
+    src = tmp_path / "_src"
+    (src / "css").mkdir(parents=True)
+    (src / "img").mkdir()
+    (src / "img" / "bg.png").write_bytes(b"png")
+    (src / "css" / "site.css").write_text(
+        '@import "base.css";\n.hero { background: url(../img/bg.png) } .x { background: url(data:image/png;base64,AA==) }'
+    )
+    (src / "css" / "base.css").write_text("body { margin: 0 }")
+    (src / "index.html").write_text('<html><head><link rel="stylesheet" href="css/site.css"></head></html>')
+
+    optimize_app(tmp_path)
+
+    html = (tmp_path / "index.html").read_text()
+    assert '@import "css/base.css"' in html
+    assert "url(img/bg.png)" in html
+    assert "url(data:image/png;base64,AA==)" in html
+    assert (tmp_path / "img" / "bg.png").exists()
@@ -0,0 +1,98 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import utils.git_helper as git_helper
+import utils.repo_router as repo_router
+from utils.manifest import record_deploy, snapshot
+from utils.repo_router import RepoRouter
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def origins(tmp_path, monkeypatch):
+    """Work in `tmp_path` and stand in for GitHub with local bare repositories `origins/<repo>.git`."""
+    monkeypatch.chdir(tmp_path)
+    template = str(tmp_path / "origins" / "{repo}.git")
+    monkeypatch.setattr(git_helper, "GIT_REMOTE_URL", template)
+    monkeypatch.setattr(repo_router, "GIT_REMOTE_URL", template)
+    for var, value in (("NAME", "tester"), ("EMAIL", "tester@example.com")):
+        monkeypatch.setenv(f"GIT_AUTHOR_{var}", value)
+        monkeypatch.setenv(f"GIT_COMMITTER_{var}", value)
+
+    def create(repo):
+        git("init", "--bare", "-q", "-b", "main", str(tmp_path / "origins" / f"{repo}.git"))
+
+    return create
+
+
+def write_app(task, content="<html>hi</html>"):
+    app = Path("generated") / task
+    app.mkdir(parents=True, exist_ok=True)
+    (app / "index.html").write_text(content)
+    return str(app)
+
+
+def tip(origins_dir, repo):
+    return git("--git-dir", str(origins_dir / f"{repo}.git"), "rev-parse", "refs/heads/main")
+
+
+def test_hash_routing_spreads_tasks_over_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    router = RepoRouter(policy="hash", shards=3, base_repo="site", owner="me")
+    repos = {router.repo_for(f"task-{i}") for i in range(30)}
+    assert repos == {"site-0", "site-1", "site-2"}
+    assert router.repo_for("task-7") == router.repo_for("task-7")
+
+
+def test_per_task_routing_uses_a_sanitised_repo_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    router = RepoRouter(policy="per-task", base_repo="site", owner="me")
+    assert router.repo_for("my task/1") == "site-my-task-1"
+
+
+def test_task_stays_in_the_repo_of_its_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = write_app("moved")
+    record_deploy(app, 1, "abc", snapshot(app), repo="site-legacy")
+    router = RepoRouter(policy="hash", shards=4, base_repo="site", owner="me")
+    assert router.repo_for("moved") == "site-legacy"
+
+
+def test_route_urls_follow_the_repo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    router = RepoRouter(policy="per-task", base_repo="site", owner="me")
+    route = router.route("demo")
+    assert route.repo == "site-demo"
+    assert route.repo_url == "https://github.com/me/site-demo"
+    assert route.pages_url == "https://me.github.io/site-demo/generated/demo/"
+
+
+@pytest.mark.parametrize("engine", ["worktree", "plumbing"])
+def test_shard_deploys_land_in_their_repo_and_noop_reuses_the_tip(origins, tmp_path, engine):
+    router = RepoRouter(policy="hash", shards=2, base_repo="site", owner="me", engine=engine,
+                        shard_dir=tmp_path / "shards")
+    tasks = {}
+    for i in range(6):
+        task = f"task-{i}"
+        tasks.setdefault(router.repo_for(task), []).append(task)
+    assert set(tasks) == {"site-0", "site-1"}
+    for repo in tasks:
+        origins(repo)
+
+    shas = {}
+    for repo, repo_tasks in tasks.items():
+        folders = [write_app(task, f"<html>{task}</html>") for task in repo_tasks]
+        shas[repo] = router.commit(folders, f"Deploy {repo}", repo)
+        assert shas[repo] == tip(tmp_path / "origins", repo)
+        listed = git("--git-dir", str(tmp_path / "origins" / f"{repo}.git"), "ls-tree", "-r", "--name-only", "main")
+        assert sorted(listed.splitlines()) == sorted(f"generated/{t}/index.html" for t in repo_tasks)
+
+    # Deploying unchanged files pushes nothing and returns the current tip
+    repo, repo_tasks = next(iter(tasks.items()))
+    assert router.commit([f"generated/{repo_tasks[0]}"], "Redeploy", repo) == shas[repo]
+    assert tip(tmp_path / "origins", repo) == shas[repo]
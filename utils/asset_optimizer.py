@@ -0,0 +1,412 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from utils.logger import get_logger
+from utils.manifest import write_if_changed, link_file
+
+logger = get_logger(__name__)
+
+ASSET_OPTIMIZATION = os.getenv("ASSET_OPTIMIZATION", "true").lower() in ("1", "true", "yes")
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", ".asset_cache")
+# Stylesheets at or below this size (after minification) are inlined into the page
+INLINE_CSS_MAX_BYTES = int(os.getenv("INLINE_CSS_MAX_BYTES", "4096"))
+
+# Model output lives here; the optimized build is written next to it. Jekyll does
+# not publish folders starting with "_", so Pages only serves the build.
+SOURCE_DIR_NAME = "_src"
+REPORT_NAME = "asset_report.json"
+# Bump when the minifiers change so cached outputs are not reused
+OPTIMIZER_VERSION = "2"
+
+_STRING_OR_COMMENT = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|/\*.*?\*/', re.S)
+_HTML_RAW_BLOCK = re.compile(r"(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)", re.S | re.I)
+_STYLESHEET_LINK = re.compile(r"<link\b[^>]*\brel=[\"']?stylesheet[\"']?[^>]*>", re.I)
+_HREF = re.compile(r"\bhref=[\"']([^\"']+)[\"']", re.I)
+_CSS_URL = re.compile(r"""(url\(\s*)(["']?)([^"')]+)(\2\s*\))""", re.I)
+_CSS_IMPORT = re.compile(r"""(@import\s*)(["'])([^"']+)(\2)""", re.I)
+_SCRIPT_SRC = re.compile(r"(<script\b[^>]*\bsrc=[\"'])([^\"']+)([\"'])", re.I)
+
+
+def source_dir(app_dir) -> Path:
+    """Folder the builder writes model output to for an app in `app_dir`."""
+    app_dir = Path(app_dir)
+    return app_dir / SOURCE_DIR_NAME if ASSET_OPTIMIZATION else app_dir
+
+
+# --- Minifiers -----------------------------------------------------------------
+
+def minify_css(css: str) -> str:
+    """Drop comments and redundant whitespace outside string literals."""
+    strings = []
+
+    def protect(match):
+        token = match.group(0)
+        if token.startswith("/*"):
+            return " "
+        strings.append(token)
+        return f"\0{len(strings) - 1}\0"
+
+    text = re.sub(r"\s+", " ", _STRING_OR_COMMENT.sub(protect, css))
+    out = []
+    # A chunk ended by "{" is a selector or at-rule prelude; one ended by ";" or "}" is a declaration
+    for chunk, end in re.findall(r"([^{};]*)([{};]|$)", text):
+        chunk = re.sub(r"\s*([,>])\s*", r"\1", chunk.strip())
+        if end in (";", "}"):
+            chunk = re.sub(r"\s*:\s*", ":", chunk)
+        if end == "}" and not chunk and out and out[-1].endswith(";"):
+            out[-1] = out[-1][:-1]
+        out.append(chunk + end)
+    return re.sub(r"\0(\d+)\0", lambda m: strings[int(m.group(1))], "".join(out)).strip()
+
+
+# Significant characters after which a "/" starts a regex literal rather than a division
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case",
+                   "do", "else", "yield", "await"}
+
+
+def minify_js(js: str) -> str:
+    """
+    Conservative JS minification: removes comments, indentation and blank
+    lines but keeps line breaks so automatic semicolon insertion is unaffected.
+    String, template and regex literals are copied verbatim. Returns the input
+    unchanged if the scanner cannot make sense of it.
+    """
+    out = []
+    i, n = 0, len(js)
+    quote = None
+    # Brace depth inside each open `${ ... }` template expression
+    templates = []
+
+    def newline():
+        while out and out[-1] in " \t":
+            out.pop()
+        if out and out[-1] != "\n":
+            out.append("\n")
+
+    def previous_token():
+        j = len(out) - 1
+        while j >= 0 and out[j] in " \t\n":
+            j -= 1
+        if j < 0:
+            return ""
+        k = j
+        while k >= 0 and (out[k].isalnum() or out[k] in "_$"):
+            k -= 1
+        return "".join(out[k + 1:j + 1]) or out[j]
+
+    while i < n:
+        ch = js[i]
+        if quote:
+            if quote == "`" and js.startswith("${", i):
+                out.append("${")
+                templates.append(0)
+                quote = None
+                i += 2
+                continue
+            out.append(ch)
+            if ch == "\\" and i + 1 < n:
+                out.append(js[i + 1])
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+            elif ch == "\n" and quote != "`":
+                return js  # Unterminated string
+            i += 1
+            continue
+
+        if ch in "'\"`":
+            quote = ch
+            out.append(ch)
+        elif ch == "{" and templates:
+            templates[-1] += 1
+            out.append(ch)
+        elif ch == "}" and templates:
+            if templates[-1] == 0:
+                templates.pop()
+                quote = "`"
+            else:
+                templates[-1] -= 1
+            out.append(ch)
+        elif js.startswith("/*", i):
+            end = js.find("*/", i + 2)
+            if end == -1:
+                return js
+            if "\n" in js[i:end]:
+                newline()
+            elif out and out[-1] not in " \t\n":
+                out.append(" ")
+            i = end + 2
+            continue
+        elif js.startswith("//", i):
+            end = js.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        elif ch == "/":
+            token = previous_token()
+            line_end = js.find("\n", i)
+            rest = js[i + 1:n if line_end == -1 else line_end]
+            if not token or token in _REGEX_KEYWORDS or token in _REGEX_PRECEDERS:
+                j, in_class = i + 1, False
+                while j < n and (js[j] != "/" or in_class):
+                    if js[j] == "\n":
+                        return js
+                    if js[j] == "\\":
+                        j += 1
+                    elif js[j] == "[":
+                        in_class = True
+                    elif js[j] == "]":
+                        in_class = False
+                    j += 1
+                if j >= n:
+                    return js
+                out.extend(js[i:j + 1])
+                i = j + 1
+                continue
+            if token in ")]}" and re.search(r"[/'\"`]", rest):
+                return js  # Division or regex literal: cannot tell which
+            out.append(ch)
+        elif ch == "\n":
+            newline()
+        elif ch in " \t\r":
+            if out and out[-1] not in " \t\n" and ch != "\r":
+                out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    if quote or templates:
+        return js
+    return "".join(out).strip()
+
+
+def minify_html(html: str) -> str:
+    """Remove comments and collapse whitespace, minifying inline styles and scripts."""
+    parts = []
+    last = 0
+    for match in _HTML_RAW_BLOCK.finditer(html):
+        parts.append(_squeeze_html(html[last:match.start()]))
+        open_tag, tag, body, close_tag = match.groups()
+        if tag.lower() == "style":
+            body = minify_css(body)
+        elif tag.lower() == "script" and "src=" not in open_tag.lower():
+            body = minify_js(body)
+        parts.append(open_tag + body + close_tag)
+        last = match.end()
+    parts.append(_squeeze_html(html[last:]))
+    return "".join(parts).strip()
+
+
+def _squeeze_html(text: str) -> str:
+    # Whitespace between inline elements is significant, so runs collapse to one space
+    text = re.sub(r"<!--(?!\[if).*?-->", "", text, flags=re.S)
+    return re.sub(r"\s+", " ", text)
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js, ".html": minify_html, ".htm": minify_html}
+
+
+# --- Per-file cache --------------------------------------------------------------
+
+class MinifyCache:
+    """Memory + disk cache of minified outputs keyed by content hash."""
+
+    def __init__(self, cache_dir=ASSET_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def minify(self, suffix: str, content: str) -> tuple:
+        """Return `(minified, cached)` for `content` of the given file type."""
+        key = hashlib.sha256(f"{OPTIMIZER_VERSION}{suffix}\0{content}".encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key], True
+        path = self.cache_dir / key
+        try:
+            result = path.read_text(encoding="utf-8")
+            cached = True
+        except OSError:
+            result = MINIFIERS[suffix](content)
+            cached = False
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                path.write_text(result, encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"⚠️ Could not write asset cache entry: {e}")
+        with self._lock:
+            self._memory[key] = result
+        return result, cached
+
+
+minify_cache = MinifyCache()
+
+
+# --- Build -----------------------------------------------------------------------
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:10]
+
+
+def _hashed_name(relative: str, content: str) -> str:
+    path = Path(relative)
+    return path.with_name(f"{path.stem}.{_content_hash(content)}{path.suffix}").as_posix()
+
+
+def _is_local(url: str) -> bool:
+    return not re.match(r"^(?:[a-z][a-z0-9+.-]*:|//|#)", url, re.I)
+
+
+def _resolve(page: str, url: str) -> str:
+    """Path of a local reference relative to the app root."""
+    url = url.split("?", 1)[0].split("#", 1)[0]
+    return os.path.normpath(os.path.join(os.path.dirname(page), url)).replace(os.sep, "/")
+
+
+def _relative_url(page: str, target: str) -> str:
+    return os.path.relpath(target, os.path.dirname(page) or ".").replace(os.sep, "/")
+
+
+def _rebase_css(css: str, sheet: str, page: str) -> str:
+    """Rewrite relative `url()` and `@import` references in stylesheet `sheet` so they work from `page`."""
+    def rebase(match):
+        prefix, quote, url, suffix = match.groups()
+        if not _is_local(url) or url.startswith("/"):
+            return match.group(0)
+        path, extra = re.match(r"([^?#]*)(.*)", url).groups()
+        return prefix + quote + _relative_url(page, _resolve(sheet, path)) + extra + suffix
+
+    return _CSS_IMPORT.sub(rebase, _CSS_URL.sub(rebase, css))
+
+
+def optimize_app(app_dir) -> dict:
+    """
+    Build the optimized app in `app_dir` from the sources in `app_dir/_src/`.
+
+    HTML, CSS and JS are minified, small stylesheets are inlined into the
+    pages that link them, and every other stylesheet or script referenced from
+    HTML is renamed to a content-hashed file with the references rewritten.
+    Other files are hard-linked (or copied) unchanged, and files whose content
+    is already up to date are not rewritten. Relative `url()` and `@import`
+    references of inlined stylesheets are rewritten relative to the page.
+    Outputs of the previous build that are no longer produced are removed.
+    Returns the size report, which is also written to `asset_report.json`.
+    """
+    app_dir = Path(app_dir)
+    src = app_dir / SOURCE_DIR_NAME
+    if not src.is_dir():
+        raise FileNotFoundError(f"No sources to optimize in {src}")
+
+    sources = {
+        p.relative_to(src).as_posix(): p for p in sorted(src.rglob("*")) if p.is_file()
+    }
+    texts = {}
+    for name, path in sources.items():
+        if path.suffix.lower() in MINIFIERS:
+            texts[name] = path.read_text()
+
+    minified, cached = {}, {}
+    for name, content in texts.items():
+        minified[name], cached[name] = minify_cache.minify(Path(name).suffix.lower(), content)
+
+    # Files pulled in by scripts or stylesheets (imports, url()) keep their names
+    referenced_elsewhere = {
+        Path(other).name for name, content in texts.items()
+        if not name.endswith((".html", ".htm"))
+        for other in texts if other != name and Path(other).name in content
+    }
+
+    pages = [n for n in minified if n.endswith((".html", ".htm"))]
+    outputs = {}
+    inlined = set()
+    renamed = {}
+    for page in pages:
+        html = minified[page]
+
+        def replace_link(match):
+            tag = match.group(0)
+            href = _HREF.search(tag)
+            if not href or not _is_local(href.group(1)):
+                return tag
+            target = _resolve(page, href.group(1))
+            css = minified.get(target)
+            if css is None or not target.endswith(".css"):
+                return tag
+            if len(css.encode("utf-8")) <= INLINE_CSS_MAX_BYTES:
+                inlined.add(target)
+                # References in the stylesheet were relative to its own folder
+                return f"<style>{_rebase_css(css, target, page)}</style>"
+            if Path(target).name in referenced_elsewhere:
+                return tag
+            renamed[target] = _hashed_name(target, css)
+            return tag.replace(href.group(1), _relative_url(page, renamed[target]))
+
+        def replace_script(match):
+            url = match.group(2)
+            if not _is_local(url):
+                return match.group(0)
+            target = _resolve(page, url)
+            js = minified.get(target)
+            if js is None or Path(target).name in referenced_elsewhere:
+                return match.group(0)
+            renamed[target] = _hashed_name(target, js)
+            return match.group(1) + _relative_url(page, renamed[target]) + match.group(3)
+
+        html = _STYLESHEET_LINK.sub(replace_link, html)
+        html = _SCRIPT_SRC.sub(replace_script, html)
+        outputs[page] = html
+
+    report_files = {}
+    for name, path in sources.items():
+        original_bytes = path.stat().st_size
+        if name in outputs:
+            out_name, content = name, outputs[name]
+        elif name in renamed:
+            out_name, content = renamed[name], minified[name]
+        elif name in minified and name in inlined:
+            out_name, content = None, None
+        elif name in minified:
+            out_name, content = name, minified[name]
+        else:
+            out_name, content = name, None  # copied verbatim
+        report_files[name] = {
+            "output": out_name,
+            "original_bytes": original_bytes,
+            "optimized_bytes": len(content.encode("utf-8")) if content is not None else (
+                original_bytes if out_name else 0),
+            "inlined": name in inlined,
+            "cached": cached.get(name, False),
+        }
+        if out_name is None:
+            continue
+        if content is None:
+            link_file(path, app_dir / out_name)
+        else:
+            write_if_changed(app_dir / out_name, content)
+
+    # Remove build outputs of the previous round that were not produced again
+    report_path = app_dir / REPORT_NAME
+    produced = {f["output"] for f in report_files.values() if f["output"]}
+    try:
+        previous = json.loads(report_path.read_text())
+        for entry in previous.get("files", {}).values():
+            stale = entry.get("output")
+            if stale and stale not in produced:
+                (app_dir / stale).unlink(missing_ok=True)
+    except (OSError, ValueError):
+        pass
+
+    original_total = sum(f["original_bytes"] for f in report_files.values())
+    optimized_total = sum(f["optimized_bytes"] for f in report_files.values())
+    report = {
+        "files": report_files,
+        "original_bytes": original_total,
+        "optimized_bytes": optimized_total,
+        "saved_bytes": original_total - optimized_total,
+    }
+    report_path.write_text(json.dumps(report, indent=2))
+    logger.info(f"✅ Optimized {len(report_files)} asset(s): {original_total} -> {optimized_total} bytes")
+    return report
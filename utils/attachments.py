@@ -0,0 +1,351 @@
+import base64
+import binascii
+import hashlib
+import ipaddress
+import json
+import mimetypes
+import os
+import re
+import socket
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from utils.asset_optimizer import source_dir
+from utils.fence_parser import safe_relative_path
+from utils.logger import get_logger
+from utils.manifest import link_file, UNTRACKED_FILES
+from utils.metrics import registry, Counter
+
+logger = get_logger(__name__)
+
+ATTACHMENT_STORE_DIR = os.getenv("ATTACHMENT_STORE_DIR", ".attachment_store")
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(20 * 1024 * 1024)))
+# Attachments decoded or downloaded at once, across all jobs
+ATTACHMENT_CONCURRENCY = int(os.getenv("ATTACHMENT_CONCURRENCY", "4"))
+ATTACHMENT_TIMEOUT = float(os.getenv("ATTACHMENT_TIMEOUT", "30"))
+ATTACHMENT_MAX_REDIRECTS = int(os.getenv("ATTACHMENT_MAX_REDIRECTS", "5"))
+# Characters of a text attachment shown to the model
+ATTACHMENT_PREVIEW_CHARS = int(os.getenv("ATTACHMENT_PREVIEW_CHARS", "300"))
+
+# Per-app record of every attachment materialized so far, by name
+ATTACHMENTS_RECORD = "attachments.json"
+CHUNK_BYTES = 64 * 1024
+# Base64 characters per decoded chunk (a multiple of 4)
+CHUNK_CHARS = CHUNK_BYTES // 3 * 4
+
+_DATA_URI = re.compile(r"^data:([^,]*?),", re.I | re.S)
+_WHITESPACE = re.compile(r"\s+")
+_TEXT_TYPES = ("text/", "application/json", "application/xml", "application/javascript", "image/svg+xml")
+
+ATTACHMENT_BYTES = registry.register(Counter(
+    "attachment_bytes_total", "Attachment bytes ingested, by whether the blob was already stored.", ("stored",)
+))
+
+
+class AttachmentTooLarge(ValueError):
+    pass
+
+
+class BlobStore:
+    """
+    Content-addressed attachment storage: a blob lives at `<root>/<sha[:2]>/<sha>`
+    and identical attachments from any task or round are stored once. Blobs are
+    written through a temporary file and renamed into place, so concurrent
+    writers of the same content are harmless.
+    """
+
+    def __init__(self, root=ATTACHMENT_STORE_DIR):
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, chunks, max_bytes: int = ATTACHMENT_MAX_BYTES, preview_bytes: int = 0) -> dict:
+        """
+        Stream `chunks` (bytes) into the store without holding them in memory.
+        Raises AttachmentTooLarge past `max_bytes`. Returns the blob's `sha256`,
+        `bytes`, whether it was `stored` already, and its first `preview_bytes` as `head`.
+        """
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp = tmp_dir / uuid.uuid4().hex
+        hasher = hashlib.sha256()
+        size = 0
+        head = b""
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge(f"larger than the {max_bytes} byte limit")
+                    if len(head) < preview_bytes:
+                        head += chunk[:preview_bytes - len(head)]
+                    hasher.update(chunk)
+                    f.write(chunk)
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            stored = target.exists()
+            if stored:
+                tmp.unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, target)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            # Release an unfinished download
+            getattr(chunks, "close", lambda: None)()
+            raise
+        return {"sha256": digest, "bytes": size, "stored": stored, "head": head}
+
+
+blob_store = BlobStore()
+
+def _is_public(address: str) -> bool:
+    address = ipaddress.ip_address(address.split("%", 1)[0])
+    return address.is_global and not address.is_multicast
+
+
+class _PublicPeerMixin:
+    """Refuse a connection whose peer is not public, whatever DNS answered at check time."""
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        peer = sock.getpeername()[0]
+        if not _is_public(peer):
+            sock.close()
+            raise NewConnectionError(self, f"refusing to fetch from non-public address {peer}")
+        return sock
+
+
+class _PublicHTTPConnection(_PublicPeerMixin, HTTPConnection):
+    pass
+
+
+class _PublicHTTPSConnection(_PublicPeerMixin, HTTPSConnection):
+    pass
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class PublicOnlyAdapter(HTTPAdapter):
+    """
+    Transport adapter whose connections check the address they actually
+    connected to, so a host that resolves to a public address for
+    `check_public_url` and a private one when connecting (DNS rebinding)
+    is still refused before any request is sent.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PublicHTTPConnectionPool,
+            "https": _PublicHTTPSConnectionPool,
+        }
+
+
+_session = requests.Session()
+# A proxy would be the connected peer, hiding where the request really goes
+_session.trust_env = False
+_session.mount("http://", PublicOnlyAdapter(pool_maxsize=ATTACHMENT_CONCURRENCY))
+_session.mount("https://", PublicOnlyAdapter(pool_maxsize=ATTACHMENT_CONCURRENCY))
+_pool = ThreadPoolExecutor(max_workers=max(1, ATTACHMENT_CONCURRENCY), thread_name_prefix="attachment")
+
+
+# --- Sources ---------------------------------------------------------------------
+
+def _base64_chunks(payload: str):
+    """Decode base64 `payload` in slices so the decoded bytes are never all in memory."""
+    carry = ""
+    for start in range(0, len(payload), CHUNK_CHARS):
+        part = carry + _WHITESPACE.sub("", payload[start:start + CHUNK_CHARS])
+        usable = len(part) - len(part) % 4
+        carry = part[usable:]
+        if usable:
+            yield base64.b64decode(part[:usable], validate=True)
+    if carry.rstrip("="):
+        yield base64.b64decode(carry + "=" * (-len(carry) % 4))
+
+
+def data_uri_source(url: str) -> tuple:
+    """`(media_type, chunks)` for a `data:` URI."""
+    match = _DATA_URI.match(url)
+    if not match:
+        raise ValueError("malformed data URI")
+    params = [p.strip() for p in match.group(1).split(";")]
+    is_base64 = "base64" in (p.lower() for p in params[1:])
+    media_type = params[0].lower() or "text/plain"
+    payload = url[match.end():]
+    if is_base64:
+        return media_type, _base64_chunks(payload)
+    data = urllib.parse.unquote_to_bytes(payload)
+    return media_type, (data[i:i + CHUNK_BYTES] for i in range(0, len(data), CHUNK_BYTES))
+
+
+def check_public_url(url: str):
+    """
+    Raise ValueError unless `url` is http(s) and its host resolves only to public
+    addresses. Attachments end up in a public repository, so loopback, private,
+    link-local (e.g. cloud metadata) and reserved addresses are never fetched.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("unsupported URL")
+    try:
+        infos = socket.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80),
+                                   type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"cannot resolve {parsed.hostname}: {e}")
+    for info in infos:
+        if not _is_public(info[4][0]):
+            raise ValueError(f"refusing to fetch from non-public address {info[4][0]}")
+
+
+def http_source(url: str, max_bytes: int = ATTACHMENT_MAX_BYTES) -> tuple:
+    """
+    `(media_type, chunks)` for an http(s) URL, streamed from the response.
+    Redirects are followed by hand so every hop is checked with `check_public_url`,
+    and the session's adapter re-checks the address each connection actually reaches.
+    """
+    for _ in range(ATTACHMENT_MAX_REDIRECTS + 1):
+        check_public_url(url)
+        response = _session.get(url, stream=True, timeout=ATTACHMENT_TIMEOUT, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        url = urllib.parse.urljoin(url, response.headers["Location"])
+        response.close()
+    else:
+        raise ValueError(f"more than {ATTACHMENT_MAX_REDIRECTS} redirects")
+    try:
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise AttachmentTooLarge(f"larger than the {max_bytes} byte limit ({length} bytes)")
+    except Exception:
+        response.close()
+        raise
+    media_type = response.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+
+    def chunks():
+        with response:
+            yield from response.iter_content(CHUNK_BYTES)
+
+    return media_type, chunks()
+
+
+# --- Ingestion -------------------------------------------------------------------
+
+def _preview(media_type: str, head: bytes, size: int) -> str:
+    """The start of a text attachment, "" for binary ones."""
+    if not media_type.startswith(_TEXT_TYPES):
+        return ""
+    text = head.decode("utf-8", errors="ignore")
+    if size > len(head) or len(text) > ATTACHMENT_PREVIEW_CHARS:
+        text = text[:ATTACHMENT_PREVIEW_CHARS].rstrip() + " ..."
+    return text
+
+
+def ingest_attachment(output_dir: Path, attachment: dict, store: BlobStore = blob_store) -> dict:
+    """
+    Store one `{name, url}` attachment and link it into `output_dir` under its
+    name. Returns its summary; failures are reported in `error` instead of raised.
+    """
+    name, url = attachment["name"], attachment["url"]
+    relative = safe_relative_path(name)
+    summary = {"name": name}
+    if not url.lower().startswith("data:"):
+        summary["url"] = url
+    try:
+        if not relative or relative in UNTRACKED_FILES:
+            raise ValueError("unsafe file name")
+        if url.lower().startswith("data:"):
+            media_type, chunks = data_uri_source(url)
+        elif url.lower().startswith(("http://", "https://")):
+            media_type, chunks = http_source(url)
+        else:
+            raise ValueError("unsupported URL scheme")
+        blob = store.put(chunks, preview_bytes=ATTACHMENT_PREVIEW_CHARS * 4)
+        media_type = (media_type if media_type and media_type != "application/octet-stream"
+                      else mimetypes.guess_type(relative)[0] or "application/octet-stream")
+        link_file(store.path(blob["sha256"]), output_dir / relative)
+    except (binascii.Error, AttachmentTooLarge, ValueError, OSError, requests.RequestException) as e:
+        logger.warning(f"⚠️ Attachment '{name}' could not be ingested: {e}")
+        summary["error"] = str(e)
+        return summary
+
+    ATTACHMENT_BYTES.inc(blob["bytes"], stored=str(blob["stored"]).lower())
+    summary.update({
+        "path": relative,
+        "type": media_type,
+        "bytes": blob["bytes"],
+        "sha256": blob["sha256"],
+        "preview": _preview(media_type, blob["head"], blob["bytes"]),
+    })
+    return summary
+
+
+def ingest_attachments(app_dir, attachments: list, on_progress=None) -> list:
+    """
+    Materialize a task's attachments next to its app sources, decoding `data:`
+    URIs and downloading http(s) URLs concurrently with bounded memory.
+    Returns one summary per attachment, also recorded in `attachments.json`.
+    """
+    app_dir = Path(app_dir)
+    output_dir = source_dir(app_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    summaries = list(_pool.map(lambda a: ingest_attachment(output_dir, a), attachments or []))
+    for summary in summaries:
+        if on_progress:
+            on_progress("attachment", name=summary["name"], bytes=summary.get("bytes"),
+                        error=summary.get("error"))
+
+    record = load_attachments(app_dir)
+    record.update({s["name"]: s for s in summaries if "path" in s})
+    (app_dir / ATTACHMENTS_RECORD).write_text(json.dumps(record, indent=2))
+    return summaries
+
+
+def load_attachments(app_dir) -> dict:
+    """Summaries of the attachments materialized in earlier rounds, by name."""
+    try:
+        return json.loads((Path(app_dir) / ATTACHMENTS_RECORD).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _human_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def describe_attachments(attachments: list) -> str:
+    """
+    Compact prompt text for attachment summaries: name, type, size and a short
+    preview of text files. Never includes `data:` payloads.
+    """
+    lines = []
+    for a in attachments or []:
+        if "path" in a:
+            lines.append(f"    - {a['path']} ({a['type']}, {_human_size(a['bytes'])}), "
+                         f"saved in the app folder; load it with the relative URL \"{a['path']}\"")
+            if a.get("preview"):
+                lines.extend(f"        {line}" for line in a["preview"].splitlines()[:10])
+        elif a.get("url", "").lower().startswith(("http://", "https://")):
+            lines.append(f"    - {a['name']}: {a['url']}")
+        else:
+            lines.append(f"    - {a['name']}: not available ({a.get('error') or 'inline data'})")
+    return "\n".join(lines) or "    None"
@@ -0,0 +1,98 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from utils.repo_router import router
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Extra time to wait for more deploys before starting a commit; 0 commits as soon as the coalescer is idle
+COMMIT_WINDOW_SECONDS = float(os.getenv("COMMIT_WINDOW_SECONDS", "0"))
+COMMIT_MAX_BATCH = int(os.getenv("COMMIT_MAX_BATCH", "50"))
+
+
+class CommitCoalescer:
+    """
+    Serializes all git commits through a single background thread.
+
+    Group commit: a folder submitted while the coalescer is idle is committed
+    straight away, and everything submitted while a commit and push are
+    running is published together as the next commit (one per target
+    repository). A `window` adds a wait for more folders before each commit.
+    Every waiting caller receives the SHA of the commit that contains its
+    folder. `commit_fn(folders, commit_msg, repo)` does the work.
+    """
+
+    def __init__(self, commit_fn=None, window: float = COMMIT_WINDOW_SECONDS,
+                 max_batch: int = COMMIT_MAX_BATCH):
+        self.commit_fn = commit_fn or router.commit
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, task_folder: str, task: str, commit_msg: str, repo: str = None) -> Future:
+        """Queue a folder for the next batch to `repo`. The Future resolves to the commit SHA."""
+        future = Future()
+        self._pending.put((task_folder, task, commit_msg, repo, future))
+        self._ensure_thread()
+        return future
+
+    def commit(self, task_folder: str, task: str, commit_msg: str, repo: str = None) -> str:
+        """Blocking variant of `submit` with the same signature as `git_commit_and_push`."""
+        return self.submit(task_folder, task, commit_msg, repo).result()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="commit-coalescer", daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> list:
+        """Block for the first item, then take everything queued meanwhile (and within the window)."""
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._pending.get(timeout=remaining))
+                else:
+                    batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            by_repo = {}
+            for item in self._collect_batch():
+                by_repo.setdefault(item[3], []).append(item)
+            for repo, batch in by_repo.items():
+                self._commit_batch(repo, batch)
+
+    def _commit_batch(self, repo, batch: list):
+        folders = list(dict.fromkeys(item[0] for item in batch))
+        tasks = list(dict.fromkeys(item[1] for item in batch))
+        if len(batch) == 1:
+            commit_msg = batch[0][2]
+        else:
+            commit_msg = f"Deploy {len(tasks)} tasks: {', '.join(tasks)}"
+
+        logger.info(f"📦 Committing batch of {len(batch)} request(s) across {len(folders)} folder(s)"
+                    + (f" to {repo}" if repo else ""))
+        try:
+            sha = self.commit_fn(folders, commit_msg, repo)
+        except Exception as e:
+            logger.error(f"❌ Batch commit failed: {e}")
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        for *_, future in batch:
+            future.set_result(sha)
+
+
+coalescer = CommitCoalescer()
@@ -1,11 +1,208 @@
-import requests
+import asyncio
 import json
+import os
+import random
 import time
+import uuid
 from pathlib import Path
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
 from utils.logger import get_logger
+from utils.metrics import RETRIES
 
 logger = get_logger(__name__)
 
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "outbox")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_PER_HOST_CONCURRENCY = int(os.getenv("OUTBOX_PER_HOST_CONCURRENCY", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "1.0"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+OUTBOX_TIMEOUT = float(os.getenv("OUTBOX_TIMEOUT", "30"))
+
+# Client errors that will not succeed on retry go straight to the dead-letter list
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+class EvaluatorOutbox:
+    """
+    Durable queue of evaluator notifications.
+
+    Each delivery is a JSON record under `<root>/pending/`; it is deleted once
+    the evaluator answers 2xx and moved to `<root>/dead/` when it fails
+    permanently or runs out of attempts. Records survive restarts and are
+    re-queued by `start()`. Delivery runs on asyncio workers sharing one pooled
+    `requests.Session`, with jittered exponential backoff between attempts and
+    a concurrency cap per evaluator host.
+    """
+
+    def __init__(self, root=OUTBOX_DIR, workers: int = OUTBOX_WORKERS,
+                 per_host: int = OUTBOX_PER_HOST_CONCURRENCY, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.root = Path(root)
+        self.pending_dir = self.root / "pending"
+        self.dead_dir = self.root / "dead"
+        self.workers = workers
+        self.per_host = per_host
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(workers, 16))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._queue = None
+        self._loop = None
+        self._tasks = []
+        self._host_limits = {}
+
+    # --- persistence -------------------------------------------------------
+
+    def _write(self, directory: Path, record: dict):
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = directory / f"{record['id']}.tmp"
+        tmp_path.write_text(json.dumps(record, indent=2))
+        os.replace(tmp_path, directory / f"{record['id']}.json")
+
+    def _read(self, directory: Path, record_id: str):
+        try:
+            return json.loads((directory / f"{record_id}.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def enqueue(self, evaluation_url: str, payload: dict, payload_path: str = None) -> dict:
+        """Persist a delivery record and hand it to the workers. Safe to call from any thread."""
+        record = {
+            "id": uuid.uuid4().hex,
+            "url": evaluation_url,
+            "payload": payload,
+            "payload_path": payload_path,
+            "attempts": 0,
+            "created_at": time.time(),
+            "next_attempt_at": time.time(),
+            "last_error": None,
+        }
+        self._write(self.pending_dir, record)
+        logger.info(f"📮 Queued evaluator notification {record['id']} for {evaluation_url}")
+        self._schedule(record["id"], 0)
+        return record
+
+    def dead_letters(self) -> list:
+        """All deliveries that were given up on, oldest first."""
+        records = [self._read(self.dead_dir, p.stem) for p in self.dead_dir.glob("*.json")]
+        return sorted((r for r in records if r), key=lambda r: r["created_at"])
+
+    def pending(self) -> list:
+        records = [self._read(self.pending_dir, p.stem) for p in self.pending_dir.glob("*.json")]
+        return sorted((r for r in records if r), key=lambda r: r["created_at"])
+
+    def retry_dead_letter(self, record_id: str):
+        """Move a dead-lettered delivery back to pending with a fresh attempt budget."""
+        record = self._read(self.dead_dir, record_id)
+        if record is None:
+            return None
+        record["attempts"] = 0
+        record["next_attempt_at"] = time.time()
+        self._write(self.pending_dir, record)
+        (self.dead_dir / f"{record_id}.json").unlink(missing_ok=True)
+        self._schedule(record_id, 0)
+        return record
+
+    # --- delivery ----------------------------------------------------------
+
+    def _schedule(self, record_id: str, delay: float):
+        if self._loop is None:
+            return  # Picked up from disk by start()
+
+        def put():
+            self._loop.call_later(max(0.0, delay), self._queue.put_nowait, record_id)
+
+        try:
+            same_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            put()
+        else:
+            self._loop.call_soon_threadsafe(put)
+
+    def _backoff(self, attempts: int) -> float:
+        """Full-jitter exponential backoff."""
+        ceiling = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)))
+        return random.uniform(0, ceiling)
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def start(self):
+        """Start the workers and re-queue every record left pending on disk."""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        for record in self.pending():
+            self._schedule(record["id"], record["next_attempt_at"] - time.time())
+        logger.info(f"✅ Evaluator outbox started ({self.workers} workers)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    async def _worker(self):
+        while True:
+            record_id = await self._queue.get()
+            try:
+                await self._attempt(record_id)
+            except Exception:
+                logger.exception(f"❌ Unexpected error delivering {record_id}")
+            finally:
+                self._queue.task_done()
+
+    async def _attempt(self, record_id: str):
+        record = self._read(self.pending_dir, record_id)
+        if record is None:
+            return  # Already delivered or dead-lettered
+
+        record["attempts"] += 1
+        attempt = record["attempts"]
+        permanent = False
+        async with self._host_limit(record["url"]):
+            try:
+                response = await asyncio.to_thread(
+                    self.session.post, record["url"], json=record["payload"], timeout=OUTBOX_TIMEOUT
+                )
+            except requests.RequestException as e:
+                record["last_error"] = str(e)
+            else:
+                if 200 <= response.status_code < 300:
+                    logger.info(f"✅ Evaluator notified for task '{record['payload'].get('task')}' (attempt {attempt})")
+                    (self.pending_dir / f"{record_id}.json").unlink(missing_ok=True)
+                    return
+                record["last_error"] = f"HTTP {response.status_code} - {response.text[:500]}"
+                permanent = 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUS
+
+        if permanent or attempt >= self.max_attempts:
+            logger.error(f"❌ Giving up on evaluator notification {record_id}: {record['last_error']}")
+            self._write(self.dead_dir, record)
+            (self.pending_dir / f"{record_id}.json").unlink(missing_ok=True)
+            return
+
+        delay = self._backoff(attempt)
+        record["next_attempt_at"] = time.time() + delay
+        self._write(self.pending_dir, record)
+        logger.warning(f"⚠️ Attempt {attempt} for {record_id} failed ({record['last_error']}). Retrying in {delay:.1f}s")
+        RETRIES.inc(operation="evaluator_delivery")
+        self._schedule(record_id, delay)
+
+
+outbox = EvaluatorOutbox()
+
+
 def notify_evaluator(
     email: str,
     task: str,
@@ -15,17 +212,18 @@ def notify_evaluator(
     github_user: str,
     repo_name: str,
     evaluation_url: str,
-    pages_url: str  # This parameter was missing
+    pages_url: str,
+    repo_url: str = None
 ) -> dict:
     """
-    Notify the evaluator that a deployment is ready for evaluation.
-    
-    Now accepts a specific pages_url to ensure the correct link is sent.
+    Record that a deployment is ready for evaluation.
+
+    The payload is saved next to the app and queued in the outbox; delivery
+    to the evaluator happens in the background and never blocks the deploy.
     """
 
-    repo_url = f"https://github.com/{github_user}/{repo_name}"
+    repo_url = repo_url or f"https://github.com/{github_user}/{repo_name}"
 
-    # The payload now uses the pages_url passed directly into the function.
     payload = {
         "email": email,
         "task": task,
@@ -42,28 +240,8 @@ def notify_evaluator(
     output_path.write_text(json.dumps(payload, indent=2))
     logger.info(f"✅ Saved evaluation payload at: {output_path.resolve()}")
 
-    # --- Step 2: Attempt to notify evaluator API ---
-    logger.info(f"🚀 Notifying evaluator at {evaluation_url}")
-    logger.debug(f"Payload: {payload}")
-
-    max_retries = 3
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = requests.post(evaluation_url, json=payload, timeout=30)
-            if response.status_code == 200:
-                logger.info(f"✅ Evaluator notified successfully (attempt {attempt})")
-                logger.debug(f"Evaluator response: {response.text}")
-                break
-            else:
-                logger.warning(f"⚠️ Attempt {attempt}: Received HTTP {response.status_code} - {response.text}")
-        except requests.RequestException as e:
-            logger.error(f"❌ Attempt {attempt} failed: {e}")
-        if attempt < max_retries:
-            logger.info("⏳ Retrying in 5 seconds...")
-            time.sleep(5)
-    else:
-        logger.error("❌ All attempts to notify evaluator failed after retries.")
-        raise RuntimeError("Failed to notify evaluator after multiple attempts.")
+    # --- Step 2: Hand the delivery to the outbox ---
+    logger.debug("Payload: %s", payload)
+    outbox.enqueue(evaluation_url, payload, str(output_path))
 
     return payload
-
@@ -0,0 +1,211 @@
+import re
+from collections import namedtuple
+from pathlib import PurePosixPath
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+FencedBlock = namedtuple("FencedBlock", ["lang", "filename", "code"])
+
+# Fence info-string language -> canonical language
+LANGUAGE_ALIASES = {
+    "html": "html", "htm": "html", "xhtml": "html",
+    "css": "css",
+    "js": "js", "javascript": "js", "mjs": "js", "jsx": "js", "es6": "js",
+    "ts": "ts", "typescript": "ts",
+    "md": "markdown", "markdown": "markdown",
+    "json": "json",
+    "svg": "svg", "xml": "xml",
+    "txt": "text", "text": "text", "plaintext": "text",
+}
+
+# File extension -> canonical language, used when a fence only names a file
+EXTENSION_LANGUAGES = {
+    ".html": "html", ".htm": "html", ".css": "css", ".js": "js", ".mjs": "js",
+    ".ts": "ts", ".md": "markdown", ".json": "json", ".svg": "svg", ".xml": "xml", ".txt": "text",
+}
+
+_KEY_VALUE_NAME = re.compile(r"""(?:filename|file|title|path|name)\s*[=:]\s*["']?([^"'\s]+)["']?""", re.I)
+_FIRST_LINE_NAME = re.compile(
+    r"""^\s*(?://|#|<!--|/\*)\s*(?:filename|file|path)\s*:\s*([^\s*>-][^\s]*?)\s*(?:-->|\*/)?\s*$""", re.I
+)
+
+
+def normalize_language(lang: str) -> str:
+    lang = lang.strip().lower()
+    return LANGUAGE_ALIASES.get(lang, lang)
+
+
+def safe_relative_path(name: str):
+    """Return `name` as a clean relative POSIX path, or None if it is absolute or escapes upwards."""
+    name = name.strip().strip("`'\"").replace("\\", "/")
+    if not name or name.startswith("/") or re.match(r"^[A-Za-z]:", name):
+        return None
+    parts = [p for p in PurePosixPath(name).parts if p not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return "/".join(parts)
+
+
+def parse_info_string(info: str) -> tuple:
+    """
+    Split a fence info string into `(lang, filename)`. Understands
+    ```js, ```javascript app.js, ```js:src/app.js, ```css filename="a.css",
+    ```html title=index.html and a bare ```src/app.js.
+    """
+    info = info.strip()
+    filename = None
+    match = _KEY_VALUE_NAME.search(info)
+    if match:
+        filename = match.group(1)
+        info = (info[:match.start()] + info[match.end():]).strip()
+
+    head, _, rest = info.partition(" ")
+    if ":" in head and filename is None:
+        head, _, filename = head.partition(":")
+    elif rest.strip() and filename is None:
+        filename = rest.strip().split()[0]
+
+    lang = normalize_language(head)
+    if filename is None and "." in head and (head.count("/") or head.rsplit(".", 1)[-1] in
+                                              {e.lstrip(".") for e in EXTENSION_LANGUAGES}):
+        filename, lang = head, ""
+    if filename is not None:
+        filename = safe_relative_path(filename)
+        if filename and not lang:
+            lang = EXTENSION_LANGUAGES.get(PurePosixPath(filename).suffix.lower(), "")
+    return lang, filename
+
+
+class FenceParser:
+    """
+    Single-pass, incremental tokenizer for Markdown code fences.
+
+    Feed response text in arbitrary chunks; every call returns the
+    `FencedBlock`s whose closing fence arrived in that chunk. Text that can no
+    longer start a fence marker is dropped (outside a block) or moved to a list
+    of code parts (inside one), and the scan position is remembered, so the
+    working buffer stays about one chunk long and total work is linear in the
+    response size however it is split.
+
+    Opening fences may appear anywhere (models often prefix them with prose);
+    a closing fence is a line starting with at least as many backticks as the
+    opening one, so code containing ``` in strings survives intact.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0          # start of unconsumed text
+        self._scan_from = 0    # no marker can start before this index
+        self._fence = None     # backtick run of the open fence, None while outside
+        self._lang = ""
+        self._filename = None
+        self._parts = []       # code of the open block already moved out of the buffer
+
+    def feed(self, chunk: str) -> list:
+        self._buffer += chunk
+        blocks = []
+        while True:
+            if self._fence is None:
+                if not self._open_fence():
+                    break
+            else:
+                block = self._close_fence()
+                if block is None:
+                    break
+                blocks.append(block)
+        self._compact()
+        return blocks
+
+    def _compact(self):
+        """Drop consumed text from the buffer, keeping only what a marker could still start in."""
+        if self._fence is not None:
+            flush_to = max(self._pos, min(self._scan_from, len(self._buffer)))
+            if flush_to > self._pos:
+                self._parts.append(self._buffer[self._pos:flush_to])
+                self._pos = flush_to
+        keep_from = min(self._pos, self._scan_from)
+        if keep_from > 0:
+            self._buffer = self._buffer[keep_from:]
+            self._pos -= keep_from
+            self._scan_from -= keep_from
+
+    def _open_fence(self) -> bool:
+        buffer = self._buffer
+        start = buffer.find("```", max(self._pos, self._scan_from))
+        if start == -1:
+            # Everything but a possible partial marker at the end is prose
+            self._pos = self._scan_from = max(self._pos, len(buffer) - 2)
+            return False
+        end = start
+        while end < len(buffer) and buffer[end] == "`":
+            end += 1
+        newline = buffer.find("\n", end)
+        if newline == -1:
+            # Fence run or info string not complete yet
+            self._pos = self._scan_from = start
+            return False
+        self._fence = buffer[start:end]
+        self._lang, self._filename = parse_info_string(buffer[end:newline])
+        # Keep the newline so an immediately closing fence is found as "\n```"
+        self._pos = newline + 1
+        self._scan_from = newline
+        return True
+
+    def _close_fence(self):
+        buffer = self._buffer
+        fence = self._fence
+        search_from = max(0, self._scan_from)
+        while True:
+            candidate = buffer.find("\n" + fence, search_from)
+            if candidate == -1:
+                # A marker can only still start in the last len(fence) characters
+                self._scan_from = max(0, self._pos - 1, len(buffer) - len(fence))
+                return None
+            line_end = buffer.find("\n", candidate + 1)
+            tail = buffer[candidate + 1 + len(fence):line_end if line_end != -1 else len(buffer)]
+            if tail.strip("` \t\r"):
+                search_from = candidate + 1
+                continue
+            if line_end == -1:
+                # Wait for the rest of the line before deciding this is a close
+                self._scan_from = candidate
+                return None
+            code = "".join(self._parts) + buffer[self._pos:max(self._pos, candidate)]
+            self._pos = line_end + 1
+            self._scan_from = self._pos
+            return self._finish(code)
+
+    def _finish(self, code: str):
+        lang, filename = self._lang, self._filename
+        self._fence, self._lang, self._filename, self._parts = None, "", None, []
+        if filename is None:
+            first_line, _, remainder = code.partition("\n")
+            match = _FIRST_LINE_NAME.match(first_line)
+            if match and safe_relative_path(match.group(1)):
+                filename = safe_relative_path(match.group(1))
+                code = remainder
+                if not lang:
+                    lang = EXTENSION_LANGUAGES.get(PurePosixPath(filename).suffix.lower(), "")
+        return FencedBlock(lang, filename, code.strip())
+
+    def close(self) -> list:
+        """Flush a block left open by a truncated response."""
+        blocks = []
+        if self._fence is not None:
+            code = "".join(self._parts) + self._buffer[self._pos:]
+            line_start = code.rfind("\n") + 1
+            if code[line_start:].strip().startswith(self._fence):
+                code = code[:line_start]
+            elif code.strip():
+                logger.warning(f"⚠️ Response ended inside an unterminated '{self._lang}' code block.")
+            if code.strip():
+                blocks.append(self._finish(code))
+        self.__init__()
+        return blocks
+
+
+def parse_fences(text: str) -> list:
+    """Parse a complete response in one pass."""
+    parser = FenceParser()
+    return parser.feed(text) + parser.close()
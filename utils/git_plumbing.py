@@ -0,0 +1,137 @@
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from utils.git_helper import run_cmd, get_remote_url, GITHUB_USERNAME, BRANCH
+from utils.logger import get_logger
+from utils.metrics import GIT_SECONDS, RETRIES
+
+logger = get_logger(__name__)
+
+# Bare repository used purely as an object store for plumbing commits
+PLUMBING_GIT_DIR = os.getenv("PLUMBING_GIT_DIR", ".deploy-cache.git")
+PLUMBING_MAX_ATTEMPTS = int(os.getenv("PLUMBING_MAX_ATTEMPTS", "5"))
+
+ZERO_SHA = "0" * 40
+
+
+def _git(git_dir, *args, env=None, input=None, check=True):
+    return run_cmd(["git", "--git-dir", str(git_dir), *args], check=check, env=env, input=input)
+
+
+def ensure_object_store(git_dir=PLUMBING_GIT_DIR) -> Path:
+    """Create the bare object store on first use."""
+    git_dir = Path(git_dir).resolve()
+    if not (git_dir / "HEAD").exists():
+        logger.info(f"Initialising plumbing object store at: {git_dir}")
+        run_cmd(["git", "init", "--bare", "-q", str(git_dir)])
+    return git_dir
+
+
+def fetch_remote_tip(git_dir, remote_url: str, branch: str):
+    """Shallow-fetch the remote branch tip. Returns its SHA, or None for an empty remote."""
+    tracking_ref = f"refs/deploy/{branch}"
+    result = _git(git_dir, "fetch", "-q", "--depth", "1", "--no-tags", remote_url,
+                  f"+refs/heads/{branch}:{tracking_ref}", check=False)
+    if result.returncode != 0:
+        if "couldn't find remote ref" in result.stderr:
+            logger.warning(f"⚠️ Remote branch '{branch}' does not exist yet. Creating a root commit.")
+            return None
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return _git(git_dir, "rev-parse", tracking_ref).stdout.strip()
+
+
+def _collect_files(task_folders: list, repo_root: Path) -> list:
+    """Return (mode, absolute_path, tree_path) for every file under the given folders."""
+    entries = []
+    for folder in task_folders:
+        folder_path = (repo_root / folder).resolve()
+        for path in sorted(p for p in folder_path.rglob("*") if p.is_file()):
+            mode = "100755" if os.access(path, os.X_OK) else "100644"
+            tree_path = path.relative_to(repo_root.resolve()).as_posix()
+            entries.append((mode, str(path), tree_path))
+    return entries
+
+
+def build_commit(git_dir, task_folders: list, commit_msg: str, parent, repo_root: Path) -> str:
+    """
+    Build a commit that replaces `task_folders` inside the parent's tree with the
+    files on disk. Uses a throwaway index file so no working tree is involved.
+    """
+    fd, index_path = tempfile.mkstemp(prefix="deploy-index-")
+    os.close(fd)
+    os.unlink(index_path)
+    env = {
+        **os.environ,
+        "GIT_INDEX_FILE": index_path,
+        "GIT_AUTHOR_NAME": GITHUB_USERNAME or "deployer",
+        "GIT_AUTHOR_EMAIL": f"{GITHUB_USERNAME or 'deployer'}@users.noreply.github.com",
+        "GIT_COMMITTER_NAME": GITHUB_USERNAME or "deployer",
+        "GIT_COMMITTER_EMAIL": f"{GITHUB_USERNAME or 'deployer'}@users.noreply.github.com",
+    }
+    try:
+        if parent:
+            _git(git_dir, "read-tree", parent, env=env)
+            # Drop whatever the parent had under the task folders so deleted files disappear
+            stale = _git(git_dir, "ls-tree", "-r", "--name-only", parent, "--",
+                         *[Path(f).as_posix() for f in task_folders]).stdout.splitlines()
+            if stale:
+                removals = "".join(f"0 {ZERO_SHA}\t{path}\n" for path in stale)
+                _git(git_dir, "update-index", "--index-info", env=env, input=removals)
+        else:
+            _git(git_dir, "read-tree", "--empty", env=env)
+
+        files = _collect_files(task_folders, repo_root)
+        if files:
+            blob_shas = _git(git_dir, "hash-object", "-w", "--no-filters", "--stdin-paths",
+                             input="".join(f"{abs_path}\n" for _, abs_path, _ in files)).stdout.split()
+            additions = "".join(
+                f"{mode} {sha}\t{tree_path}\n" for (mode, _, tree_path), sha in zip(files, blob_shas)
+            )
+            _git(git_dir, "update-index", "--add", "--index-info", env=env, input=additions)
+
+        tree = _git(git_dir, "write-tree", env=env).stdout.strip()
+        parent_args = ["-p", parent] if parent else []
+        return _git(git_dir, "commit-tree", tree, *parent_args, "-m", commit_msg, env=env).stdout.strip()
+    finally:
+        if os.path.exists(index_path):
+            os.unlink(index_path)
+
+
+def plumbing_commit_and_push(task_folders: list, commit_msg: str, remote_url: str = None,
+                             branch: str = BRANCH, git_dir=PLUMBING_GIT_DIR, repo_root=None,
+                             max_attempts: int = PLUMBING_MAX_ATTEMPTS) -> str:
+    """
+    Commit `task_folders` on top of the remote branch tip without touching the
+    working tree, then push the new commit. A rejected (non fast-forward) push
+    is retried against the freshly fetched tip. When the folders match the tip
+    already, nothing is pushed and the tip's SHA is returned.
+    """
+    remote_url = remote_url or get_remote_url()
+    repo_root = Path(repo_root or os.getcwd())
+    git_dir = ensure_object_store(git_dir)
+
+    for attempt in range(1, max_attempts + 1):
+        with GIT_SECONDS.time(operation="fetch"):
+            parent = fetch_remote_tip(git_dir, remote_url, branch)
+        with GIT_SECONDS.time(operation="commit"):
+            sha = build_commit(git_dir, task_folders, commit_msg, parent, repo_root)
+        if parent:
+            new_tree, parent_tree = _git(git_dir, "rev-parse", f"{sha}^{{tree}}", f"{parent}^{{tree}}").stdout.split()
+            if new_tree == parent_tree:
+                logger.info(f"No file changes to commit. Reusing commit {parent}.")
+                return parent
+
+        logger.info(f"Pushing {sha} to {branch} (attempt {attempt})...")
+        with GIT_SECONDS.time(operation="push"):
+            result = _git(git_dir, "push", "-q", remote_url, f"{sha}:refs/heads/{branch}", check=False)
+        if result.returncode == 0:
+            logger.info(f"✅ Successfully pushed commit with SHA: {sha}")
+            return sha
+        if "non-fast-forward" in result.stderr or "fetch first" in result.stderr or "rejected" in result.stderr:
+            logger.warning(f"⚠️ Push rejected because {branch} moved. Rebuilding on the new tip...")
+            RETRIES.inc(operation="git_push")
+            continue
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+
+    raise RuntimeError(f"Push to {branch} kept being rejected after {max_attempts} attempts.")
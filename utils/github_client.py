@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from utils.logger import get_logger
+from utils.metrics import RETRIES
+
+logger = get_logger(__name__)
+
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+# Override to point the client at a local stub server
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "15"))
+GITHUB_RATE_LIMIT_MAX_WAIT = float(os.getenv("GITHUB_RATE_LIMIT_MAX_WAIT", "60"))
+PAGES_BUILD_TIMEOUT = float(os.getenv("PAGES_BUILD_TIMEOUT", "300"))
+PAGES_BUILD_POLL_INTERVAL = float(os.getenv("PAGES_BUILD_POLL_INTERVAL", "5"))
+
+
+class GitHubAPIError(Exception):
+    """Raised for GitHub API responses the client cannot handle."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"GitHub API error {status_code}: {message}")
+        self.status_code = status_code
+
+
+class RateLimitError(GitHubAPIError):
+    """Raised when the rate limit resets later than we are willing to wait."""
+
+
+class GitHubClient:
+    """
+    Thin GitHub REST client shared by every deploy.
+
+    One pooled session carries auth and timeouts. GETs are conditional on the
+    last ETag (304s do not count against the rate limit), Pages configuration
+    is cached per repository so an already-enabled site is not POSTed again,
+    and the rate-limit headers of every response are honoured.
+    """
+
+    def __init__(self, token: str = GITHUB_TOKEN, api_url: str = GITHUB_API_URL, timeout: float = GITHUB_TIMEOUT):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Accept"] = "application/vnd.github.v3+json"
+        if token:
+            self.session.headers["Authorization"] = f"token {token}"
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._etags = {}
+        self._pages = {}
+        self._repos = {}
+        self._contains = {}
+        self._rate_remaining = None
+        self._rate_reset = 0.0
+
+    # --- transport ---------------------------------------------------------
+
+    def _wait_for_rate_limit(self):
+        with self._lock:
+            remaining, reset = self._rate_remaining, self._rate_reset
+        if remaining is None or remaining > 0:
+            return
+        wait = reset - time.time()
+        if wait <= 0:
+            return
+        if wait > GITHUB_RATE_LIMIT_MAX_WAIT:
+            raise RateLimitError(403, f"Rate limit exhausted until {time.ctime(reset)}")
+        logger.warning(f"⚠️ GitHub rate limit exhausted. Waiting {wait:.0f}s for reset.")
+        time.sleep(wait)
+
+    def _record_rate_limit(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        with self._lock:
+            if remaining is not None:
+                self._rate_remaining = int(remaining)
+            if reset is not None:
+                self._rate_reset = float(reset)
+
+    def request(self, method: str, path: str, **kwargs):
+        """Send a request, waiting out an exhausted rate limit and retrying once if throttled."""
+        url = f"{self.api_url}{path}"
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in (1, 2):
+            self._wait_for_rate_limit()
+            response = self.session.request(method, url, **kwargs)
+            self._record_rate_limit(response)
+            throttled = response.status_code == 429 or (
+                response.status_code == 403 and response.headers.get("X-RateLimit-Remaining") == "0"
+            )
+            if not throttled or attempt == 2:
+                return response
+            RETRIES.inc(operation="github_api")
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                with self._lock:
+                    self._rate_remaining = 0
+                    self._rate_reset = time.time() + float(retry_after)
+        return response
+
+    def get_json(self, path: str):
+        """Conditional GET: returns the cached body when GitHub answers 304. None on 404."""
+        cached = self._etags.get(path)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        response = self.request("GET", path, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        if response.status_code == 404:
+            self._etags.pop(path, None)
+            return None
+        if response.status_code != 200:
+            raise GitHubAPIError(response.status_code, response.text)
+        body = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._etags[path] = (etag, body)
+        return body
+
+    # --- Repositories ------------------------------------------------------
+
+    def ensure_repo(self, owner: str, repo: str) -> dict:
+        """Create `owner/repo` under the authenticated user unless it already exists."""
+        key = f"{owner}/{repo}"
+        if key in self._repos:
+            return self._repos[key]
+        info = self.get_json(f"/repos/{owner}/{repo}")
+        if info is None:
+            logger.info(f"Creating repository {key}...")
+            response = self.request("POST", "/user/repos", json={"name": repo, "auto_init": False})
+            if response.status_code == 201:
+                info = response.json()
+            elif response.status_code == 422:
+                info = self.get_json(f"/repos/{owner}/{repo}") or {"name": repo}
+            else:
+                raise GitHubAPIError(response.status_code, response.text)
+        self._repos[key] = info
+        return info
+
+    # --- Pages -------------------------------------------------------------
+
+    def get_pages(self, owner: str, repo: str):
+        return self.get_json(f"/repos/{owner}/{repo}/pages")
+
+    def ensure_pages(self, owner: str, repo: str, branch: str, path: str = "/") -> dict:
+        """Enable Pages for `owner/repo` unless it is already known to be enabled."""
+        key = f"{owner}/{repo}"
+        if key in self._pages:
+            return self._pages[key]
+
+        config = self.get_pages(owner, repo)
+        if config is None:
+            logger.info("Attempting to enable GitHub Pages...")
+            response = self.request(
+                "POST", f"/repos/{owner}/{repo}/pages", json={"source": {"branch": branch, "path": path}}
+            )
+            if response.status_code == 201:
+                logger.info("✅ GitHub Pages enabled successfully.")
+                config = response.json()
+            elif response.status_code == 409:
+                logger.info("⚠️ GitHub Pages was already enabled.")
+                config = self.get_pages(owner, repo) or {"source": {"branch": branch, "path": path}}
+            else:
+                raise GitHubAPIError(response.status_code, response.text)
+        else:
+            logger.info("GitHub Pages already enabled, skipping enable call.")
+
+        self._pages[key] = config
+        return config
+
+    def latest_pages_build(self, owner: str, repo: str):
+        return self.get_json(f"/repos/{owner}/{repo}/pages/builds/latest")
+
+    def commit_contains(self, owner: str, repo: str, commit_sha: str, ancestor_sha: str) -> bool:
+        """True if `commit_sha` is `ancestor_sha` or has it in its history (cached per pair)."""
+        key = (owner, repo, commit_sha, ancestor_sha)
+        if key not in self._contains:
+            comparison = self.get_json(f"/repos/{owner}/{repo}/compare/{ancestor_sha}...{commit_sha}")
+            self._contains[key] = bool(comparison) and comparison.get("status") in ("ahead", "identical")
+        return self._contains[key]
+
+    def wait_for_pages_build(self, owner: str, repo: str, commit_sha: str,
+                             timeout: float = PAGES_BUILD_TIMEOUT,
+                             interval: float = PAGES_BUILD_POLL_INTERVAL) -> dict:
+        """
+        Poll until a Pages build covering `commit_sha` has finished.
+        A finished build of a later commit that contains `commit_sha` counts:
+        GitHub may skip straight to the newest push, so the build for our exact
+        commit might never appear. Returns the build record; its `status` is
+        "built" or "errored", or "timeout" if no covering build finished within
+        `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        build = None
+        while time.monotonic() < deadline:
+            build = self.latest_pages_build(owner, repo)
+            built_sha = (build or {}).get("commit")
+            if built_sha and build.get("status") in ("built", "errored") and (
+                    built_sha == commit_sha or self.commit_contains(owner, repo, built_sha, commit_sha)):
+                covered = "" if built_sha == commit_sha else f" (covered by {built_sha[:7]})"
+                logger.info(f"✅ Pages build for {commit_sha[:7]} finished{covered}: {build['status']}")
+                return build
+            time.sleep(interval)
+        logger.warning(f"⚠️ Pages build for {commit_sha[:7]} did not finish within {timeout:.0f}s")
+        return {**(build or {}), "status": "timeout", "commit": commit_sha}
+
+github_client = GitHubClient()
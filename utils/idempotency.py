@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", ".idempotency.sqlite3")
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+
+
+def make_idempotency_key(email: str, task: str, round_: int, nonce: str) -> str:
+    """Stable key identifying one logical deployment request."""
+    material = json.dumps([email, task, round_, nonce])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    SQLite-backed record of which job owns each request key and how it ended.
+
+    A key is owned while its job is "running" or after it "succeeded"; failed,
+    abandoned and expired entries can be claimed again by a new job.
+    """
+
+    def __init__(self, path=IDEMPOTENCY_DB, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.path = str(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS requests (
+                key TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS requests_job_id ON requests (job_id)")
+
+    @staticmethod
+    def _row_to_dict(row) -> dict:
+        key, job_id, status, result, error, created_at, updated_at = row
+        return {
+            "key": key,
+            "job_id": job_id,
+            "status": status,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM requests WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        record = self._row_to_dict(row)
+        if self.ttl > 0 and time.time() - record["created_at"] > self.ttl:
+            return None
+        return record
+
+    def claim(self, key: str, job_id: str):
+        """
+        Assign `key` to `job_id` unless another job already owns it.
+        Returns None on success, or the owning record for a duplicate request.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT * FROM requests WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    record = self._row_to_dict(row)
+                    fresh = self.ttl <= 0 or now - record["created_at"] <= self.ttl
+                    if fresh and record["status"] in ("running", "succeeded"):
+                        self._conn.execute("COMMIT")
+                        return record
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO requests VALUES (?, ?, 'running', NULL, NULL, ?, ?)",
+                    (key, job_id, now, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None
+
+    def complete(self, job_id: str, status: str, result: dict = None, error: str = None):
+        """Store the outcome of a job under whichever key it owns."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE requests SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def release(self, key: str, job_id: str):
+        """Drop a claim whose job never got queued."""
+        with self._lock:
+            self._conn.execute("DELETE FROM requests WHERE key = ? AND job_id = ?", (key, job_id))
+
+    def abandon_in_flight(self) -> int:
+        """Mark jobs left "running" by a previous process so their keys can be retried."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE requests SET status = 'abandoned', updated_at = ? WHERE status = 'running'",
+                (time.time(),)
+            )
+        if cursor.rowcount:
+            logger.warning(f"⚠️ Marked {cursor.rowcount} interrupted request(s) as abandoned.")
+        return cursor.rowcount
+
+    def purge_expired(self) -> int:
+        if self.ttl <= 0:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM requests WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+        return cursor.rowcount
@@ -0,0 +1,206 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from utils.logger import get_logger
+from utils.metrics import STAGE_SECONDS, DEPLOYS_IN_FLIGHT, JOBS_TOTAL
+
+logger = get_logger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """A single pipeline execution tracked by the job queue."""
+
+    def __init__(self, payload, loop=None, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events = []
+        self.timings = {}
+        self._stage_started = self.created_at
+        self._loop = loop
+        self._changed = asyncio.Event() if loop is not None else None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def set_stage(self, stage: str):
+        """Record the pipeline stage the job is currently in."""
+        self._close_stage()
+        self.stage = stage
+        logger.info(f"🔧 Job {self.id}: stage -> {stage}")
+        self.emit("stage")
+
+    def _close_stage(self):
+        """Add the time spent in the current stage to `timings`."""
+        now = time.time()
+        elapsed = now - self._stage_started
+        self.timings[self.stage] = round(self.timings.get(self.stage, 0.0) + elapsed, 6)
+        if self.stage != "done":
+            STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        self._stage_started = now
+        self.updated_at = now
+
+    def emit(self, event: str, **data):
+        """Record a progress event. Safe to call from pipeline worker threads."""
+        self.events.append({"event": event, "stage": self.stage, "ts": time.time(), **data})
+        if self._loop is None:
+            return
+        try:
+            same_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            self._changed.set()
+        else:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    async def stream_events(self):
+        """Yield recorded events, then new ones as they arrive, until the job finishes."""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished or self._changed is None:
+                return
+            self._changed.clear()
+            if index < len(self.events):
+                continue
+            await self._changed.wait()
+
+    async def wait(self):
+        """Wait until the job has succeeded or failed."""
+        async for _ in self.stream_events():
+            pass
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "timings": self.timings,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobQueue:
+    """
+    Bounded asyncio job queue drained by a fixed pool of workers.
+
+    `handler` is an async callable `handler(payload, job)` whose return value
+    becomes the job result. Blocking work inside the handler must be pushed
+    off the event loop (e.g. with `asyncio.to_thread`). `on_finish(job)` is
+    called once a job has succeeded or failed.
+    """
+
+    def __init__(self, handler, max_workers: int = 2, max_queue: int = 100, max_retained: int = 1000,
+                 on_finish=None):
+        self.handler = handler
+        self.on_finish = on_finish
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_retained = max_retained
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._workers = []
+        self._loop = None
+
+    async def start(self):
+        """Create the queue and spawn the worker tasks on the running loop."""
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.max_workers)
+        ]
+        logger.info(f"✅ Job queue started ({self.max_workers} workers, queue size {self.max_queue})")
+
+    async def stop(self):
+        """Cancel all workers. Queued jobs that never started are dropped."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, payload, job_id: str = None) -> Job:
+        """Enqueue a payload and return its Job. Raises QueueFullError when full."""
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started.")
+        job = Job(payload, self._loop, job_id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_queue} pending jobs).")
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    async def put(self, payload, job_id: str = None) -> Job:
+        """Like `submit`, but waits for room in the queue instead of raising QueueFullError."""
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started.")
+        job = Job(payload, self._loop, job_id)
+        await self._queue.put(job)
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _prune(self):
+        """Forget the oldest finished jobs once more than `max_retained` are tracked."""
+        excess = len(self.jobs) - self.max_retained
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self.jobs.values() if j.finished][:excess]:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            DEPLOYS_IN_FLIGHT.inc()
+            try:
+                job.result = await self.handler(job.payload, job)
+                job.status = "succeeded"
+                job.set_stage("done")
+                job.emit("succeeded", result=job.result)
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Cancelled"
+                job.emit("failed", error=job.error)
+                raise
+            except Exception as e:
+                logger.exception(f"❌ Job {job.id} failed in stage '{job.stage}'")
+                job.status = "failed"
+                job.error = str(e)
+                job._close_stage()
+                job.emit("failed", error=job.error)
+            finally:
+                DEPLOYS_IN_FLIGHT.dec()
+                JOBS_TOTAL.inc(status=job.status)
+                self._queue.task_done()
+                if self.on_finish and job.finished:
+                    try:
+                        self.on_finish(job)
+                    except Exception:
+                        logger.exception(f"❌ on_finish hook failed for job {job.id}")
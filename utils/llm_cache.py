@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+def make_cache_key(prompt: str, model_name: str, config: dict) -> str:
+    """Content address of a model call: hash of prompt, model name and generation config."""
+    material = json.dumps(
+        {"prompt": prompt, "model": model_name, "config": config},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for model responses.
+
+    The memory tier is an LRU of at most `max_entries` responses; the disk tier
+    stores one JSON file per key and evicts the oldest files once the directory
+    exceeds `max_bytes`. Entries older than `ttl` seconds are treated as misses
+    in both tiers.
+    """
+
+    def __init__(self, cache_dir=LLM_CACHE_DIR, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES, ttl: float = LLM_CACHE_TTL_SECONDS):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str):
+        """Return the cached response text for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            path = self._path(key)
+            try:
+                record = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                record = None
+            if record is not None:
+                if not self._expired(record["created_at"]):
+                    self._remember(key, record["created_at"], record["text"])
+                    self.counters["disk_hits"] += 1
+                    return record["text"]
+                path.unlink(missing_ok=True)
+
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, key: str, text: str):
+        """Store a response in both tiers."""
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, created_at, text)
+            self.counters["stores"] += 1
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = self._path(key).with_suffix(".tmp")
+                tmp_path.write_text(json.dumps({"created_at": created_at, "text": text}), encoding="utf-8")
+                os.replace(tmp_path, self._path(key))
+                self._evict_disk()
+            except OSError as e:
+                logger.warning(f"⚠️ Could not write LLM cache entry to disk: {e}")
+
+    def _remember(self, key: str, created_at: float, text: str):
+        self._memory[key] = (created_at, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Delete the least recently written files until the tier fits in `max_bytes`."""
+        files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.cache_dir.glob("*.json")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            for path in self.cache_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hits": hits,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "enabled": LLM_CACHE_ENABLED,
+            }
+
+
+llm_cache = LLMCache()
@@ -1,11 +1,78 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for one structured object per line, "text" for the classic human-readable format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Render a record as a single JSON line, including any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue a copy of each record untouched. The stock `prepare` formats the
+    message and traceback on the calling thread and drops `exc_info`; here all
+    formatting happens on the listener thread and tracebacks keep their own field.
+    """
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+
+_queue = queue.SimpleQueue()
+_listener = None
+
+
+def _start_listener():
+    """Start the single background thread that writes every queued record to stderr."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    _listener = logging.handlers.QueueListener(_queue, handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
 
 def get_logger(name: str):
+    """
+    Return a logger whose records are handed to a queue and written by a
+    background thread, keeping log I/O off the request path.
+    """
     logger = logging.getLogger(name)
     if not logger.handlers:
-        logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler()
-        fmt = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-        handler.setFormatter(fmt)
-        logger.addHandler(handler)
+        _start_listener()
+        logger.setLevel(LOG_LEVEL)
+        logger.addHandler(_DeferredQueueHandler(_queue))
+        logger.propagate = False
     return logger
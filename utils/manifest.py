@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Dot-prefixed so it never collides with an app's own (e.g. PWA) manifest.json
+MANIFEST_NAME = ".deploy-manifest.json"
+# Where deploys before the rename kept it
+LEGACY_MANIFEST_NAME = "manifest.json"
+# Pipeline bookkeeping kept next to the app. Written on every run whatever the app
+# contents, so they never make a deploy "changed", and never sent to or written by the model
+UNTRACKED_FILES = {MANIFEST_NAME, "evaluation_payload.json", "update_log.txt", "asset_report.json",
+                   "attachments.json"}
+
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def path_digest(path) -> str:
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _temp_sibling(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+def write_if_changed(path: Path, content) -> bool:
+    """
+    Write `content` (str or bytes) to `path` unless the file already holds exactly that. Returns True if written.
+    The file is replaced rather than rewritten in place, so hard links to it (see `link_file`) are never modified.
+    """
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _temp_sibling(path)
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return True
+
+
+def link_file(source: Path, target: Path) -> bool:
+    """
+    Make `target` a hard link to `source` (a copy when linking is not possible)
+    unless it already has the same content. Returns True if written.
+    """
+    source, target = Path(source), Path(target)
+    try:
+        if os.path.samefile(source, target):
+            return False
+        if target.stat().st_size == source.stat().st_size and path_digest(target) == path_digest(source):
+            return False
+    except OSError:
+        pass
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _temp_sibling(target)
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+    return True
+
+
+def snapshot(app_dir) -> dict:
+    """`{relative_path: {"sha256", "bytes"}}` for every deployed file of an app."""
+    app_dir = Path(app_dir)
+    files = {}
+    for path in sorted(app_dir.rglob("*")):
+        relative = path.relative_to(app_dir).as_posix()
+        if relative == LEGACY_MANIFEST_NAME and _read_manifest(path):
+            continue
+        if path.is_file() and relative not in UNTRACKED_FILES:
+            data = path.read_bytes()
+            files[relative] = {"sha256": file_digest(data), "bytes": len(data)}
+    return files
+
+
+def diff_files(old: dict, new: dict) -> dict:
+    """Added, removed and modified paths between two snapshots."""
+    return {
+        "added": sorted(set(new) - set(old)),
+        "removed": sorted(set(old) - set(new)),
+        "modified": sorted(p for p in set(old) & set(new) if old[p]["sha256"] != new[p]["sha256"]),
+    }
+
+
+def _read_manifest(path: Path):
+    """A deploy manifest stored at `path`, or None (an app's own manifest.json has no `rounds`)."""
+    try:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) and isinstance(manifest.get("rounds"), dict) else None
+
+
+def load_manifest(app_dir):
+    """The task's manifest, or None if it was never deployed."""
+    app_dir = Path(app_dir)
+    return _read_manifest(app_dir / MANIFEST_NAME) or _read_manifest(app_dir / LEGACY_MANIFEST_NAME)
+
+
+def unchanged_commit(app_dir, files: dict):
+    """SHA of the last deploy if it published exactly `files`, else None."""
+    manifest = load_manifest(app_dir)
+    if manifest and manifest.get("commit_sha") and manifest.get("files") == files:
+        return manifest["commit_sha"]
+    return None
+
+
+def record_deploy(app_dir, round_num: int, commit_sha: str, files: dict, repo: str = None) -> dict:
+    """
+    Store the deployed file hashes for `round_num` in `generated/<task>/.deploy-manifest.json`.
+    The manifest keeps the latest state at the top level and every round under
+    `rounds`, each with its diff against the previous deploy.
+    """
+    app_dir = Path(app_dir)
+    manifest = load_manifest(app_dir) or {"task": app_dir.name, "rounds": {}}
+    previous = manifest.get("files", {})
+    changes = diff_files(previous, files)
+    manifest.update({
+        "repo": repo or manifest.get("repo"),
+        "round": round_num,
+        "commit_sha": commit_sha,
+        "updated_at": time.time(),
+        "files": files,
+    })
+    manifest["rounds"][str(round_num)] = {
+        "repo": manifest["repo"],
+        "commit_sha": commit_sha,
+        "updated_at": manifest["updated_at"],
+        "files": files,
+        "changes": changes,
+    }
+    tmp_path = app_dir / f"{MANIFEST_NAME}.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, app_dir / MANIFEST_NAME)
+    legacy_path = app_dir / LEGACY_MANIFEST_NAME
+    if _read_manifest(legacy_path):
+        legacy_path.unlink()
+    logger.info(
+        f"🧾 Manifest for '{app_dir.name}' round {round_num}: {len(changes['added'])} added, "
+        f"{len(changes['modified'])} modified, {len(changes['removed'])} removed"
+    )
+    return manifest
@@ -0,0 +1,227 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from utils.logger import get_logger
+from utils.metrics import registry, Gauge, Histogram, RETRIES
+
+logger = get_logger(__name__)
+
+LLM_RPM = float(os.getenv("LLM_RPM", "60"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+# Calls slower than this are treated like a mild throttle signal
+LLM_TARGET_LATENCY = float(os.getenv("LLM_TARGET_LATENCY", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "2.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+
+# Lower value = served first. Throttled calls are re-queued in the "retry" lane
+LANES = {"new": 0, "update": 1, "retry": 2}
+
+LLM_QUEUE_SECONDS = registry.register(Histogram(
+    "llm_queue_wait_seconds", "Time model calls wait for the scheduler, by priority lane.", ("lane",)
+))
+LLM_CONCURRENCY_LIMIT = registry.register(Gauge(
+    "llm_concurrency_limit", "Current adaptive limit on concurrent model calls."
+))
+LLM_WAITING = registry.register(Gauge(
+    "llm_calls_waiting", "Model calls waiting for the scheduler, by priority lane.", ("lane",)
+))
+
+
+class CallCancelled(Exception):
+    """Raised for a call abandoned while it waited for admission."""
+
+
+def is_throttle_error(exc: Exception) -> bool:
+    """True for provider rate-limit errors (HTTP 429 / RESOURCE_EXHAUSTED)."""
+    code = getattr(exc, "code", None)
+    if code == 429 or getattr(code, "value", None) == 429:
+        return True
+    return type(exc).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to `per_minute`. Not thread-safe on its own."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (requests larger than the bucket wait for a full one)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate) if self.rate > 0 else 0.0
+
+    def consume(self, amount: float):
+        """Take `amount` units; negative amounts give units back. The level may go below zero."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class ModelScheduler:
+    """
+    Admission control for model calls, shared by every worker thread.
+
+    Calls wait in priority lanes and are admitted in lane order when both the
+    requests-per-minute and tokens-per-minute buckets allow it and fewer than
+    the adaptive concurrency limit are in flight. The limit follows AIMD: it
+    grows by about one per round of successful calls and is halved on a 429
+    (or cut by 10% when a call exceeds the latency target), and a 429 also
+    pauses admissions for a backoff period.
+    """
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 min_concurrency: int = LLM_MIN_CONCURRENCY, target_latency: float = LLM_TARGET_LATENCY,
+                 max_retries: int = LLM_MAX_RETRIES):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._waiting = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._latencies = deque(maxlen=500)
+        LLM_CONCURRENCY_LIMIT.set(self.limit)
+
+    # --- admission ---------------------------------------------------------
+
+    def _admit(self, lane: str, tokens: float, cancelled=None):
+        entry = (LANES[lane], next(self._counter))
+        queued_at = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            LLM_WAITING.inc(lane=lane)
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    LLM_WAITING.dec(lane=lane)
+                    self._cond.notify_all()
+                    raise CallCancelled("Model call cancelled while waiting for admission.")
+                wait = None
+                if self._waiting[0] == entry and self.in_flight < int(self.limit):
+                    wait = max(self._paused_until - time.monotonic(),
+                               self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if wait <= 0:
+                        break
+                self._cond.wait(timeout=wait)
+            heapq.heappop(self._waiting)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.in_flight += 1
+            LLM_WAITING.dec(lane=lane)
+            # The next caller in line may be admissible too
+            self._cond.notify_all()
+        LLM_QUEUE_SECONDS.observe(time.monotonic() - queued_at, lane=lane)
+
+    def _release(self, latency: float, throttled: bool, aborted: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            # An abandoned call says nothing about the provider's latency or capacity
+            if not aborted:
+                if not throttled:
+                    self._latencies.append(latency)
+                if throttled:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                elif latency > self.target_latency:
+                    self.limit = max(self.min_concurrency, self.limit * 0.9)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                LLM_CONCURRENCY_LIMIT.set(round(self.limit, 3))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: str = "new", tokens: float = 0, cancelled=None):
+        """
+        Hold one admitted model call for the duration of the block. A call whose
+        `cancelled` event is set while it waits, or by the time it is admitted,
+        raises CallCancelled without reaching the provider.
+        """
+        self._admit(lane, tokens, cancelled)
+        if cancelled is not None and cancelled.is_set():
+            with self._cond:
+                # Hand back what the call reserved
+                self.requests.consume(-1)
+                self.tokens.consume(-tokens)
+            self._release(0.0, throttled=False, aborted=True)
+            raise CallCancelled("Model call cancelled before it started.")
+        started = time.monotonic()
+        throttled = aborted = False
+        try:
+            yield
+        except Exception as e:
+            throttled = is_throttle_error(e)
+            raise
+        except BaseException:
+            # A streaming consumer abandoned the generator holding the slot
+            aborted = True
+            raise
+        finally:
+            self._release(time.monotonic() - started, throttled, aborted)
+
+    def wake(self):
+        """Let waiting calls re-check their `cancelled` events."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def latency_percentile(self, percentile: float, min_samples: int = 20):
+        """The given percentile of recent call latencies, or None with fewer than `min_samples` calls."""
+        with self._cond:
+            samples = sorted(self._latencies)
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+    def record_tokens(self, extra: float):
+        """Correct the token bucket once actual usage is known (`extra` may be negative)."""
+        with self._cond:
+            self.tokens.consume(extra)
+
+    # --- retries -----------------------------------------------------------
+
+    def should_retry(self, exc: Exception, attempt: int) -> bool:
+        return is_throttle_error(exc) and attempt < self.max_retries
+
+    def backoff(self, attempt: int) -> float:
+        """Pause admissions after a 429 and return the jittered delay."""
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        RETRIES.inc(operation="llm_call")
+        logger.warning(f"⚠️ Model call throttled. Retrying in {delay:.1f}s (limit {self.limit:.1f})")
+        return delay
+
+    def call(self, fn, lane: str = "new", tokens: float = 0):
+        """Run `fn()` in an admitted slot, re-queueing it in the retry lane when throttled."""
+        for attempt in itertools.count():
+            try:
+                with self.slot(lane if attempt == 0 else "retry", tokens):
+                    return fn()
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    raise
+                self.backoff(attempt)
+
+
+scheduler = ModelScheduler()
@@ -0,0 +1,114 @@
+import re
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SEARCH_MARKER = re.compile(r"^<{5,9} SEARCH\s*$")
+DIVIDER_MARKER = re.compile(r"^={5,9}\s*$")
+REPLACE_MARKER = re.compile(r"^>{5,9} REPLACE\s*$")
+
+
+class PatchError(Exception):
+    """Raised when an edit cannot be applied unambiguously."""
+
+
+def parse_search_replace(text: str) -> list:
+    """
+    Parse search/replace edit blocks of the form
+
+        style.css
+        <<<<<<< SEARCH
+        body { color: red; }
+        =======
+        body { color: blue; }
+        >>>>>>> REPLACE
+
+    Returns a list of `(file_name, search, replace)` tuples in response order.
+    The file name is the last non-empty line before the SEARCH marker.
+    """
+    edits = []
+    lines = text.splitlines()
+    current_file = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if SEARCH_MARKER.match(line):
+            search, replace = [], []
+            i += 1
+            while i < len(lines) and not DIVIDER_MARKER.match(lines[i]):
+                search.append(lines[i])
+                i += 1
+            i += 1
+            while i < len(lines) and not REPLACE_MARKER.match(lines[i]):
+                replace.append(lines[i])
+                i += 1
+            if current_file is None:
+                logger.warning("⚠️ Skipping edit block without a file name.")
+            else:
+                edits.append((current_file, "\n".join(search), "\n".join(replace)))
+        else:
+            stripped = line.strip().strip("`*").strip()
+            if stripped and not stripped.startswith("```"):
+                current_file = stripped
+        i += 1
+    return edits
+
+
+def _apply_one(content: str, search: str, replace: str) -> str:
+    if not search.strip():
+        # An empty SEARCH means "replace the whole file"
+        return replace
+    count = content.count(search)
+    if count == 1:
+        return content.replace(search, replace, 1)
+    if count > 1:
+        raise PatchError("search text matches more than once")
+
+    # Tolerate differences in indentation/trailing whitespace by matching stripped lines
+    content_lines = content.splitlines()
+    search_lines = [l.strip() for l in search.splitlines()]
+    matches = [
+        start for start in range(len(content_lines) - len(search_lines) + 1)
+        if [l.strip() for l in content_lines[start:start + len(search_lines)]] == search_lines
+    ]
+    if len(matches) != 1:
+        raise PatchError("search text not found" if not matches else "search text matches more than once")
+    start = matches[0]
+    new_lines = content_lines[:start] + replace.splitlines() + content_lines[start + len(search_lines):]
+    return "\n".join(new_lines) + ("\n" if content.endswith("\n") else "")
+
+
+def apply_edits(files: dict, edits: list) -> tuple:
+    """
+    Apply edits to a `{name: content}` mapping.
+    Returns `(updated, failed)`: the new contents of every file that changed,
+    and the set of file names with at least one edit that could not be applied.
+    Edits for a failed file are discarded as a whole so it is never half-patched.
+    """
+    working = {}
+    failed = set()
+    for name, search, replace in edits:
+        if name in failed:
+            continue
+        content = working.get(name, files.get(name))
+        if content is None:
+            if search.strip():
+                logger.warning(f"⚠️ Edit targets unknown file '{name}'.")
+                failed.add(name)
+                continue
+            content = ""
+        try:
+            working[name] = _apply_one(content, search, replace)
+        except PatchError as e:
+            logger.warning(f"⚠️ Could not apply edit to '{name}': {e}")
+            failed.add(name)
+            working.pop(name, None)
+
+    updated = {name: content for name, content in working.items()
+               if name not in failed and content != files.get(name)}
+    for name, content in list(updated.items()):
+        if not content.strip():
+            logger.warning(f"⚠️ Edits to '{name}' produced an empty file.")
+            failed.add(name)
+            del updated[name]
+    return updated, failed
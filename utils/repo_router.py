@@ -0,0 +1,89 @@
+import hashlib
+import os
+import re
+from collections import namedtuple
+from pathlib import Path
+from utils.git_helper import (
+    commit_folders_and_push, sparse_commit_and_push, get_remote_url,
+    GITHUB_USERNAME, GIT_REMOTE_URL, REPO_NAME,
+)
+from utils.git_plumbing import plumbing_commit_and_push
+from utils.github_client import github_client
+from utils.manifest import load_manifest
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# "single": every task in REPO_NAME; "hash": REPO_NAME-0 .. REPO_NAME-(N-1) by task hash;
+# "per-task": one repository per task, REPO_NAME-<task>
+REPO_ROUTING = os.getenv("REPO_ROUTING", "single")
+REPO_SHARDS = int(os.getenv("REPO_SHARDS", "4"))
+# Sparse clones (worktree engine) and object stores (plumbing engine) of shard repositories
+SHARD_CLONE_DIR = os.getenv("SHARD_CLONE_DIR", ".deploy-shards")
+# "worktree" commits via git in a working tree, "plumbing" builds trees directly
+COMMIT_ENGINE = os.getenv("COMMIT_ENGINE", "worktree")
+
+ROUTING_POLICIES = ("single", "hash", "per-task")
+
+Route = namedtuple("Route", ["repo", "repo_url", "pages_url"])
+
+
+class RepoRouter:
+    """
+    Maps tasks to the GitHub repository they are deployed to.
+
+    With one repository, every deploy pulls and pushes all tasks ever deployed
+    and every Pages build rebuilds all of them. Spreading tasks over N shard
+    repositories, or giving each task its own, keeps that cost flat. A task
+    stays in the repository of its first deploy (recorded in its manifest), so
+    changing the policy or the shard count only affects new tasks.
+    """
+
+    def __init__(self, policy: str = REPO_ROUTING, shards: int = REPO_SHARDS, base_repo: str = REPO_NAME,
+                 owner: str = GITHUB_USERNAME, engine: str = COMMIT_ENGINE, shard_dir=SHARD_CLONE_DIR):
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown REPO_ROUTING '{policy}', expected one of {', '.join(ROUTING_POLICIES)}")
+        self.policy = policy
+        self.shards = max(1, shards)
+        self.base_repo = base_repo
+        self.owner = owner
+        self.engine = engine
+        self.shard_dir = Path(shard_dir)
+
+    def repo_for(self, task: str) -> str:
+        manifest = load_manifest(Path("generated") / task)
+        if manifest and manifest.get("repo"):
+            return manifest["repo"]
+        if self.policy == "hash":
+            shard = int(hashlib.sha256(task.encode("utf-8")).hexdigest()[:8], 16) % self.shards
+            return f"{self.base_repo}-{shard}"
+        if self.policy == "per-task":
+            return f"{self.base_repo}-{re.sub(r'[^A-Za-z0-9._-]+', '-', task)}"
+        return self.base_repo
+
+    def route(self, task: str) -> Route:
+        repo = self.repo_for(task)
+        return Route(
+            repo=repo,
+            repo_url=f"https://github.com/{self.owner}/{repo}",
+            pages_url=f"https://{self.owner}.github.io/{repo}/generated/{task}/",
+        )
+
+    def commit(self, task_folders: list, commit_msg: str, repo: str = None) -> str:
+        """Commit and push `task_folders` to `repo` with the configured engine. Returns the commit SHA."""
+        repo = repo or self.base_repo
+        if repo == self.base_repo and self.policy == "single":
+            if self.engine == "plumbing":
+                return plumbing_commit_and_push(task_folders, commit_msg)
+            return commit_folders_and_push(task_folders, commit_msg)
+
+        if not GIT_REMOTE_URL:
+            github_client.ensure_repo(self.owner, repo)
+        remote_url = get_remote_url(repo)
+        if self.engine == "plumbing":
+            return plumbing_commit_and_push(task_folders, commit_msg, remote_url=remote_url,
+                                            git_dir=self.shard_dir / f"{repo}.git")
+        return sparse_commit_and_push(task_folders, commit_msg, remote_url, self.shard_dir / repo)
+
+
+router = RepoRouter()
@@ -0,0 +1,109 @@
+import re
+
+_QUOTED = re.compile(r"""(["'`])((?:\\.|(?!\1).)+)\1""")
+_ID = re.compile(r"(?<![\w&])#([A-Za-z][\w-]*)")
+_TAG = re.compile(r"<([a-zA-Z][a-zA-Z0-9-]*)")
+_LOCAL_REF = re.compile(r"""(?:src|href)\s*=\s*["'](?![a-z]+:|//|#)([^"'?#]+)""", re.I)
+_SELECTOR_ID = re.compile(r"#([A-Za-z][\w-]*)")
+_SELECTOR_CLASS = re.compile(r"\.([A-Za-z][\w-]*)")
+_HTML_TAGS = {
+    "a", "article", "aside", "body", "button", "canvas", "code", "div", "footer", "form", "h1", "h2", "h3",
+    "h4", "h5", "h6", "header", "img", "input", "label", "li", "main", "nav", "ol", "option", "p", "pre",
+    "section", "select", "span", "svg", "table", "tbody", "td", "textarea", "th", "thead", "tr", "ul",
+}
+# JS member names that look like ".class" but never are
+_JS_MEMBERS = {"textContent", "innerText", "innerHTML", "value", "length", "trim", "includes", "querySelector",
+               "querySelectorAll", "getElementById", "classList", "contains", "src", "href", "checked", "min",
+               "max", "toLowerCase", "toUpperCase", "children", "style", "dataset", "js", "css", "html", "json", "md"}
+
+
+def check_terms(check: str) -> list:
+    """`(kind, value)` pairs a check refers to: ("id", x), ("class", x), ("tag", x) or ("text", x)."""
+    terms = []
+    for _, literal in _QUOTED.findall(check):
+        selector_terms = _selector_terms(literal)
+        if selector_terms:
+            terms.extend(selector_terms)
+        elif len(literal.strip()) >= 2:
+            terms.append(("text", literal.strip()))
+    bare = _QUOTED.sub(" ", check)
+    terms.extend(("id", v) for v in _ID.findall(bare))
+    terms.extend(("tag", v.lower()) for v in _TAG.findall(bare))
+    return list(dict.fromkeys(terms))
+
+
+def _selector_terms(literal: str) -> list:
+    """Terms of a literal that is a CSS selector, or [] if it does not look like one."""
+    if not re.fullmatch(r"[\w\s#.\-\[\]=\"':>,*()+~]+", literal) or not re.search(r"[#.\[]", literal):
+        return []
+    tags = re.findall(r"(?:^|[\s>+~,])([a-z][a-z0-9]*)(?=[#.\[:\s>+~,]|$)", literal.strip())
+    if not literal.lstrip().startswith(("#", ".", "[")) and not (tags and set(tags) <= _HTML_TAGS):
+        return []  # e.g. "cdn.jsdelivr.net" or "data.json"
+    terms = [("id", v) for v in _SELECTOR_ID.findall(literal)]
+    terms += [("class", v) for v in _SELECTOR_CLASS.findall(literal) if v not in _JS_MEMBERS]
+    terms += [("tag", v) for v in tags]
+    return terms
+
+
+def _term_found(kind: str, value: str, html: str, everything: str) -> bool:
+    escaped = re.escape(value)
+    if kind == "id":
+        return bool(re.search(rf"""id\s*=\s*["']?{escaped}\b""", html)
+                    or re.search(rf"""["'`]#?{escaped}["'`]""", everything))
+    if kind == "class":
+        return bool(re.search(rf"""class\s*=\s*["'][^"']*\b{escaped}\b""", html)
+                    or re.search(rf"""\b{escaped}\b""", everything))
+    if kind == "tag":
+        return bool(re.search(rf"<{escaped}\b", html, re.I) or f"createElement('{value}'" in everything
+                    or f'createElement("{value}"' in everything)
+    return value.lower() in everything.lower()
+
+
+def structure_score(files: dict) -> float:
+    """0..1 for the basics: a real index.html whose local references all exist."""
+    html = files.get("index.html", "")
+    if not html or html.lstrip().startswith("<!-- Missing"):
+        return 0.0
+    score = 0.5
+    if re.search(r"<(html|body)\b", html, re.I):
+        score += 0.25
+    refs = set(_LOCAL_REF.findall(html))
+    if all(ref.lstrip("./") in files for ref in refs):
+        score += 0.25
+    return score
+
+
+def score_candidate(files: dict, checks: list) -> dict:
+    """
+    Score a candidate's `{path: content}` files against `checks`.
+
+    Checks are written for a browser-based evaluator (free text or JS such as
+    `document.querySelector("#total-sales")`). Without a browser we extract
+    what they point at (quoted strings, #ids, .classes, <tags>) and look for
+    it in the files. `score` is 0..1: mostly the share of scorable checks whose
+    terms are all present, plus a structural component. Checks without
+    recognisable terms are reported as `unscored` and do not count either way.
+    Pure and picklable, so it can run in a process pool.
+    """
+    html = "\n".join(c for p, c in files.items() if p.endswith((".html", ".htm")))
+    everything = "\n".join(files.values())
+    passed, failed, unscored = [], [], []
+    for check in checks or []:
+        terms = check_terms(check)
+        if not terms:
+            unscored.append(check)
+        elif all(_term_found(kind, value, html, everything) for kind, value in terms):
+            passed.append(check)
+        else:
+            failed.append(check)
+
+    structure = structure_score(files)
+    scored = len(passed) + len(failed)
+    score = 0.8 * len(passed) / scored + 0.2 * structure if scored else structure
+    return {
+        "score": round(score, 4),
+        "structure": structure,
+        "passed": passed,
+        "failed": failed,
+        "unscored": unscored,
+    }